@@ -0,0 +1,418 @@
+import base64
+import io
+import logging
+import os
+import sys
+import time
+from typing import Dict, NamedTuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import calibration
+import drawing
+import planner
+
+log = logging.getLogger(__name__)
+
+PAGE_COLOR = (50, 80, 170)  # background of the simulated screen, far from every palette color
+
+# where skribbl has its canvas and its color buttons; another page can be drawn on with other selectors
+CANVAS_SELECTOR = "#canvasGame"
+PALETTE_SELECTOR = ".containerColorbox"
+
+# dispatches a batch of [type, x, y, buttons] at whatever is at x, y of the viewport, like a real mouse
+DISPATCH_SCRIPT = """
+for (const [type, x, y, buttons] of arguments[0]) {
+    const target = document.elementFromPoint(x, y) || document.body;
+    const init = {bubbles: true, cancelable: true, view: window, clientX: x, clientY: y, button: 0, buttons: buttons};
+    const pointer = Object.assign({pointerId: 1, pointerType: "mouse", isPrimary: true}, init);
+    target.dispatchEvent(new PointerEvent("pointer" + type, pointer));
+    target.dispatchEvent(new MouseEvent("mouse" + type, init));
+    if (type === "up") {
+        target.dispatchEvent(new MouseEvent("click", init));
+    }
+}
+"""
+RECT_SCRIPT = """
+const r = document.querySelector(arguments[0]).getBoundingClientRect();
+return [r.left, r.top, r.width, r.height];
+"""
+CDP_TYPES = {"move": "mouseMoved", "down": "mousePressed", "up": "mouseReleased"}
+
+
+class InputBackend:
+    """Everything the Drawer needs from a mouse. Only the left button is ever used."""
+
+    position = (0, 0)
+
+    def move(self, dx, dy):
+        x, y = self.position
+        self.position = (x + dx, y + dy)
+
+    def press(self):
+        raise NotImplementedError
+
+    def release(self):
+        raise NotImplementedError
+
+    def click(self):
+        self.press()
+        self.release()
+
+    def flush(self):
+        """Sends events that are still queued. The Drawer calls this once per stroke."""
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def clock(self):
+        return time.perf_counter()
+
+
+class PynputBackend(InputBackend):
+    """Moves the real mouse cursor."""
+
+    def __init__(self):
+        from pynput.mouse import Button, Controller
+        self.controller = Controller()
+        self.button = Button.left
+
+    @property
+    def position(self):
+        return self.controller.position
+
+    @position.setter
+    def position(self, position):
+        self.controller.position = position
+
+    def move(self, dx, dy):
+        self.controller.move(dx, dy)
+
+    def press(self):
+        self.controller.press(self.button)
+
+    def release(self):
+        self.controller.release(self.button)
+
+    def click(self):
+        self.controller.click(self.button)
+
+
+class XTestBackend(InputBackend):
+    """Fakes pointer events with the X11 XTest extension and sends them in batches.
+
+    Events are only queued on the X connection, which goes out as a whole on flush (once per stroke)
+    or before any sleep, so pacing gaps are still kept between what the X server sees. Unlike pynput,
+    which waits for a round trip on every call, this never reads from the server after connecting.
+    """
+
+    def __init__(self, display_name=None):
+        from Xlib import X, display
+        from Xlib.ext import xtest
+        self.X = X
+        self.fake_input = xtest.fake_input
+        self.display = display.Display(display_name)
+        if not self.display.has_extension("XTEST"):
+            raise RuntimeError("the X server has no XTEST extension")
+        pointer = self.display.screen().root.query_pointer()
+        self._position = (pointer.root_x, pointer.root_y)
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = (int(position[0]), int(position[1]))
+        self.fake_input(self.display, self.X.MotionNotify, x=self._position[0], y=self._position[1])
+
+    def press(self):
+        self.fake_input(self.display, self.X.ButtonPress, 1)
+
+    def release(self):
+        self.fake_input(self.display, self.X.ButtonRelease, 1)
+
+    def flush(self):
+        self.display.flush()
+
+    def sleep(self, seconds):
+        self.flush()
+        time.sleep(seconds)
+
+
+class DevToolsBackend(InputBackend):
+    """Sends pointer events straight to the page of a Chrome that selenium controls (see browser.GameBrowser).
+
+    Positions are CSS pixels of the viewport, so layout() reads where canvas and palette are from the
+    page instead of the screen, and the real mouse is left alone. Events are queued and go out as one
+    injected script on flush (once per stroke) or before any sleep, so pacing gaps are still kept
+    between batches. With `trusted`, every event is sent as DevTools' Input.dispatchMouseEvent instead:
+    one round trip each, but the page cannot tell them from real input.
+
+    The canvas can be read back, which makes the backend a verify.CaptureSource too.
+    """
+
+    def __init__(self, driver, trusted=False, canvas_selector=CANVAS_SELECTOR, palette_selector=PALETTE_SELECTOR):
+        self.driver = driver
+        self.trusted = trusted
+        self.canvas_selector = canvas_selector
+        self.palette_selector = palette_selector
+        self.queue = []  # [type, x, y, buttons]
+        self.sent = 0
+        self._position = (0, 0)
+        self._buttons = 0
+
+    def _queue(self, event):
+        self.queue.append([event, self._position[0], self._position[1], self._buttons])
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = (float(position[0]), float(position[1]))
+        self._queue("move")
+
+    def press(self):
+        self._buttons = 1
+        self._queue("down")
+
+    def release(self):
+        self._buttons = 0
+        self._queue("up")
+
+    def flush(self):
+        if not self.queue:
+            return
+        if self.trusted:
+            for event, x, y, buttons in self.queue:
+                self.driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
+                    "type": CDP_TYPES[event], "x": x, "y": y, "buttons": buttons,
+                    "button": "none" if event == "move" else "left", "clickCount": 0 if event == "move" else 1,
+                })
+        else:
+            self.driver.execute_script(DISPATCH_SCRIPT, self.queue)
+        self.sent += len(self.queue)
+        self.queue = []
+
+    def sleep(self, seconds):
+        self.flush()
+        time.sleep(seconds)
+
+    def _rect(self, selector):
+        return self.driver.execute_script(RECT_SCRIPT, selector)
+
+    def layout(self) -> calibration.Calibration:
+        """Where canvas and palette are in the viewport, and the page's zoom from the canvas' shown width."""
+        canvas_left, canvas_top, canvas_width, _ = self._rect(self.canvas_selector)
+        palette_left, palette_top, _, _ = self._rect(self.palette_selector)
+        return calibration.Calibration((round(canvas_left), round(canvas_top)),
+                                       (round(palette_left), round(palette_top)),
+                                       canvas_width / calibration.CANVAS_SIZE[0])
+
+    def grab(self, box) -> Image.Image:
+        """The canvas' own pixels in `box` (viewport pixels), the page around it left white."""
+        data = self.driver.execute_script(
+            "return document.querySelector(arguments[0]).toDataURL('image/png');", self.canvas_selector)
+        canvas = Image.open(io.BytesIO(base64.b64decode(data.split(",", 1)[1]))).convert("RGBA")
+        left, top, width, height = self._rect(self.canvas_selector)
+        canvas = canvas.resize((round(width), round(height)), Image.NEAREST)
+        # cropping outside the canvas and pixels nothing was drawn on are transparent, the game shows them white
+        canvas = canvas.crop((box[0] - round(left), box[1] - round(top), box[2] - round(left), box[3] - round(top)))
+        return Image.alpha_composite(Image.new("RGBA", canvas.size, (255, 255, 255, 255)), canvas).convert("RGB")
+
+
+def screen_backend() -> InputBackend:
+    """The fastest backend that works here: XTest on X11, pynput everywhere else."""
+    if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        try:
+            return XTestBackend()
+        except Exception as e:
+            log.warning("XTest not available, falling back to pynput: %s", e)
+    return PynputBackend()
+
+
+class CanvasReport(NamedTuple):
+    events: int
+    events_by_type: Dict[str, int]
+    elapsed: float  # simulated seconds, including sleeps
+    fidelity: float  # share of canvas pixels inside the drawing grid that got the right color
+    dropped: int  # events the simulated game missed because they came too soon
+
+
+class VirtualCanvas(InputBackend):
+    """Records every input event and paints it onto an in-memory skribbl canvas instead of the screen.
+
+    Canvas and palette sit at fixed screen positions like in the game: presses on the canvas draw with
+    the selected tool, presses on the palette select colors, tools and brush sizes (using the offsets
+    from drawing.py). Brushes are round with the diameter of their size, and the fill bucket floods
+    exactly one color, like skribbl's. Time is simulated: every event takes `latency` seconds (a number,
+    or a dict by event type) and sleeps only advance the clock.
+
+    `accept_gaps` models a game that cannot keep up: it maps a kind of event (as in pacing.EVENTS) to the
+    time the game needs after it, and events arriving sooner are dropped. A dropped move leaves a
+    straight line from the last move the game saw, a dropped release keeps the brush down.
+    """
+
+    def __init__(self, canvas_top_left=(0, 100), colors_top_left=(0, 720), canvas_size=(800, 600), latency=0.001,
+                 brush_size=10, accept_gaps=None):
+        self.canvas_top_left = canvas_top_left
+        self.colors_top_left = colors_top_left
+        if not isinstance(latency, dict):
+            latency = {event: latency for event in ("move", "press", "release", "click")}
+        self.latency = latency
+        self.image = Image.new("P", canvas_size, planner.WHITE)
+        self.image.putpalette(planner.palette_image().getpalette())
+        self.painter = ImageDraw.Draw(self.image)
+        self.color = planner.BLACK
+        self.tool = "brush"
+        self.size = brush_size
+        self.accept_gaps = accept_gaps or {}
+        self.events = []  # (simulated time, event type, x, y)
+        self.elapsed = 0.0
+        self.dropped = 0
+        self._position = (0, 0)
+        self._received = (0, 0)  # the last position the game saw
+        self._last_accepted = (None, 0.0)
+        self._pressed = "press"  # kind of the last press, a palette button only counts once released
+        self.drawing = False
+
+    def _record(self, event):
+        self.elapsed += self.latency.get(event, 0.0)
+        self.events.append((self.elapsed, event) + tuple(self._position))
+
+    def _accept(self, kind) -> bool:
+        last_kind, last_time = self._last_accepted
+        if self.elapsed - last_time < self.accept_gaps.get(last_kind, 0.0) - 1e-12:
+            self.dropped += 1
+            return False
+        self._last_accepted = (kind, self.elapsed)
+        return True
+
+    def _kind(self, event):
+        """Presses and clicks on the palette count as color, tool or brush events."""
+        if self._on_canvas(self._position) is not None:
+            return event
+        x, y = self._position[0] - self.colors_top_left[0], self._position[1] - self.colors_top_left[1]
+        button = drawing.COLOR_BUTTON_SIZE
+        if 0 <= x < button * 11 and 0 <= y < button * 2:
+            return "color"
+        for kind, offsets in (("tool", drawing.TOOL_OFFSETS), ("brush", drawing.BRUSH_OFFSETS)):
+            if any(abs(x - ox) <= button / 2 and abs(y - oy) <= button / 2 for ox, oy in offsets.values()):
+                return kind
+        return event
+
+    def _on_canvas(self, position):
+        x, y = position[0] - self.canvas_top_left[0], position[1] - self.canvas_top_left[1]
+        width, height = self.image.size
+        return (x, y) if 0 <= x < width and 0 <= y < height else None
+
+    def _dot(self, point):
+        r = self.size / 2
+        self.painter.ellipse((point[0] - r, point[1] - r, point[0] + r, point[1] + r), fill=self.color)
+
+    def _select(self, position):
+        x, y = position[0] - self.colors_top_left[0], position[1] - self.colors_top_left[1]
+        button = drawing.COLOR_BUTTON_SIZE
+        if 0 <= x < button * 11 and 0 <= y < button * 2:
+            self.color = int(y // button) * 11 + int(x // button)
+            return
+        half = button / 2
+        for tool, (tx, ty) in drawing.TOOL_OFFSETS.items():
+            if abs(x - tx) <= half and abs(y - ty) <= half:
+                self.tool = tool
+                return
+        for size, (sx, sy) in drawing.BRUSH_OFFSETS.items():
+            if abs(x - sx) <= half and abs(y - sy) <= half:
+                self.size = size
+                return
+
+    def _press(self):
+        self._received = self._position
+        point = self._on_canvas(self._position)
+        if point is None:
+            self._select(self._position)
+        elif self.tool == "fill":
+            ImageDraw.floodfill(self.image, point, self.color)
+        else:
+            self.drawing = True
+            self._dot(point)
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = tuple(position)
+        self._record("move")
+        if not self._accept("move"):
+            return
+        previous, self._received = self._received, self._position
+        if self.drawing:
+            start = (previous[0] - self.canvas_top_left[0], previous[1] - self.canvas_top_left[1])
+            end = (position[0] - self.canvas_top_left[0], position[1] - self.canvas_top_left[1])
+            self.painter.line([start, end], fill=self.color, width=self.size)
+            self._dot(end)
+
+    def press(self):
+        self._record("press")
+        self._pressed = self._kind("press")
+        if self._accept("press"):
+            self._press()
+
+    def release(self):
+        self._record("release")
+        if self._accept("release" if self._pressed == "press" else self._pressed):
+            self.drawing = False
+
+    def click(self):
+        self._record("click")
+        if self._accept(self._kind("click")):
+            self._press()
+            self.drawing = False
+
+    def sleep(self, seconds):
+        self.elapsed += seconds
+
+    def clock(self):
+        return self.elapsed
+
+    def grab(self, box) -> Image.Image:
+        """A screenshot of the simulated screen: the canvas and the color buttons on a plain page.
+
+        This makes the canvas a verify.CaptureSource and gives calibration.py screens to search.
+        """
+        left, top, right, bottom = box
+        screen = Image.new("RGB", (right - left, bottom - top), PAGE_COLOR)
+        screen.paste(self.image.convert("RGB"), (self.canvas_top_left[0] - left, self.canvas_top_left[1] - top))
+        painter = ImageDraw.Draw(screen)
+        half = drawing.COLOR_BUTTON_SIZE // 2
+        for (x, y), color in zip(drawing.COLOR_OFFSETS, planner.PALETTE):
+            x, y = self.colors_top_left[0] + x - left, self.colors_top_left[1] + y - top
+            painter.rectangle((x - half, y - half, x + half - 1, y + half - 1), fill=color)
+        return screen
+
+    def fidelity(self, target: np.ndarray, step_size=planner.CELL_SIZE) -> float:
+        """Compares the canvas with the target grid, every grid pixel being a square centered where it is drawn."""
+        canvas = np.asarray(self.image)
+        height, width = target.shape
+        ys = (np.arange(canvas.shape[0]) + step_size // 2) // step_size
+        xs = (np.arange(canvas.shape[1]) + step_size // 2) // step_size
+        ys, xs = ys[ys < height], xs[xs < width]
+        expected = target[ys[:, None], xs[None, :]]
+        return float(np.mean(canvas[:len(ys), :len(xs)] == expected))
+
+    def report(self, target: np.ndarray, step_size=planner.CELL_SIZE) -> CanvasReport:
+        by_type = {}
+        for _, event, _, _ in self.events:
+            by_type[event] = by_type.get(event, 0) + 1
+        return CanvasReport(
+            events=len(self.events),
+            events_by_type=by_type,
+            elapsed=self.elapsed,
+            fidelity=self.fidelity(target, step_size),
+            dropped=self.dropped,
+        )
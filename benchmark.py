@@ -0,0 +1,177 @@
+"""Plans images and draws them onto a virtual canvas, so planner changes can be measured without a display."""
+import argparse
+import base64
+import json
+import logging
+
+import backends
+import browser
+import budget
+import images
+import ordering
+import pacing
+import planner
+import quantizer
+import verify
+from backends import VirtualCanvas
+from drawing import Drawer
+from metrics import Metrics
+
+# a stand-in for the game's page for --backend devtools: canvas and color buttons where VirtualCanvas has
+# them, with the game's selectors. It draws what it gets and counts the events in window.received.
+STANDIN_PAGE = """<!DOCTYPE html>
+<html><body style="margin: 0">
+<canvas id="canvasGame" width="800" height="600" style="position: absolute; left: 0; top: 100px"></canvas>
+<div class="containerColorbox" style="position: absolute; left: 0; top: 720px; width: 264px"></div>
+<script>
+const palette = document.querySelector(".containerColorbox");
+for (const color of %s) {
+    const button = document.createElement("div");
+    button.style = "float: left; width: 24px; height: 24px; background: rgb(" + color + ")";
+    palette.appendChild(button);
+}
+const context = document.getElementById("canvasGame").getContext("2d");
+context.lineWidth = 10;
+context.lineCap = "round";
+window.received = {};
+for (const type of ["pointerdown", "pointermove", "pointerup", "mousedown", "mousemove", "mouseup", "click"]) {
+    document.addEventListener(type, (e) => { window.received[type] = (window.received[type] || 0) + 1; });
+}
+document.addEventListener("mousedown", (e) => {
+    if (e.target.parentNode === palette) {
+        context.strokeStyle = e.target.style.background;
+    }
+    context.beginPath();
+    context.moveTo(e.offsetX, e.offsetY);
+});
+document.addEventListener("mousemove", (e) => {
+    if (e.buttons && e.target === context.canvas) {
+        context.lineTo(e.offsetX, e.offsetY);
+        context.stroke();
+    }
+});
+</script>
+</body></html>
+""" % json.dumps([list(color) for color in planner.PALETTE])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--fill", action="store_true", help="use the fill bucket for large areas")
+    parser.add_argument("--sizes", action="store_true", help="use bigger brushes for large areas")
+    parser.add_argument("--dither", choices=quantizer.DITHERS, default="floyd-steinberg")
+    parser.add_argument("--metric", choices=quantizer.METRICS, default="rgb", help="color distance for quantizing")
+    parser.add_argument("--progressive", action="store_true",
+                        help="draw a rough version first, then refine it; takes longer overall, worth it with fast "
+                             "pacing and --dither none")
+    parser.add_argument("--contours", action="store_true", help="only draw outlines, with --fill large areas sparsely")
+    parser.add_argument("--budget", type=float, help="seconds the drawing may take, picks the resolution to fit")
+    parser.add_argument("--latency", type=float, default=0.001, help="simulated seconds per input event")
+    parser.add_argument("--pacing", default="legacy", help="pacing profile to draw with (see pacing.py)")
+    parser.add_argument("--game-gaps", default="{}", type=json.loads, metavar="JSON",
+                        help="seconds the simulated game needs after each kind of event, events sent sooner get lost")
+    parser.add_argument("--autotune", action="store_true",
+                        help="tune the pacing on the first image and save it as the 'tuned' profile")
+    parser.add_argument("--backend", choices=("virtual", "pynput", "xtest", "devtools"), default="virtual",
+                        help="also draw with a real backend (best on an Xvfb display, devtools draws on a stand-in "
+                             "page in headless Chrome) and measure its throughput")
+    parser.add_argument("--chromedriver", default="./chromedriver", help="chromedriver for --backend devtools")
+    parser.add_argument("--trusted", action="store_true",
+                        help="send --backend devtools events over DevTools instead of an injected script")
+    parser.add_argument("--verify", type=int, default=0, metavar="PASSES",
+                        help="check the canvas after drawing and redraw what is wrong, at most PASSES times")
+    parser.add_argument("--verbose", action="store_true", help="log every stroke")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    profiles = pacing.load_profiles()
+    chrome = None
+    if args.backend == "devtools":
+        chrome = browser.ChromeSession(args.chromedriver)
+        chrome.driver.get("data:text/html;base64," + base64.b64encode(STANDIN_PAGE.encode()).decode())
+
+    def draw(idx, passes, gaps, step_size=planner.CELL_SIZE, corrections=0):
+        """Draws the passes one after the other, returns the report and (time, fidelity) after every pass.
+
+        With `corrections`, verify.correct follows, and the share of wrong cells before and after each of
+        its passes is the last entry of the progress.
+        """
+        canvas = VirtualCanvas(latency=args.latency, accept_gaps=args.game_gaps)
+        drawer = Drawer(canvas, canvas.canvas_top_left, canvas.colors_top_left, step_size, pacing=gaps)
+        progress = []
+        for plan in passes:
+            drawer.draw(plan)
+            if len(passes) > 1:
+                progress.append((canvas.elapsed, canvas.fidelity(idx)))
+        if corrections:
+            progress.append(verify.correct(drawer, canvas, idx, corrections))
+        return canvas.report(idx), progress
+
+    for i, path in enumerate(args.images):
+        metrics = Metrics()
+        with metrics.phase("decode"):
+            img = images.decode(path)
+        with metrics.phase("quantize"):
+            idx = planner.quantize(img, dither=args.dither, metric=args.metric)
+        if args.budget is not None:
+            model = budget.CostModel(latency=args.latency, gaps=profiles[args.pacing])
+            plan, cell, predicted = budget.plan_within_budget(img, args.budget, model, dither=args.dither,
+                                                             metric=args.metric)
+            report, _ = draw(idx, [plan], profiles[args.pacing], cell)
+            print("%s: %d px cells, predicted %.1f s, took %.1f s, fidelity %.3f"
+                  % (path, cell, predicted, report.elapsed, report.fidelity))
+            continue
+        with metrics.phase("plan"):
+            model = budget.CostModel(latency=args.latency, gaps=profiles[args.pacing])
+            if args.progressive and not args.contours:
+                passes = planner.plan_progressive(idx, switch=model.switch_events())
+            else:
+                passes = [planner.plan_strokes(idx, args.fill, planner.BRUSH_SIZES if args.sizes else None,
+                                               args.contours, switch=model.switch_events())]
+        with metrics.phase("order"):
+            passes = [[ordering.order_color_strokes(color) for color in plan] for plan in passes]
+        plan = [color for plan in passes for color in plan]
+        if args.autotune and i == 0:
+            def tune_draw(gaps):
+                report, _ = draw(idx, [plan], gaps)
+                return report.fidelity, report.dropped
+
+            gaps = pacing.autotune(tune_draw)
+            pacing.save_profile("tuned", gaps)
+            profiles["tuned"] = gaps
+            print("tuned pacing:", gaps)
+        report, progress = draw(idx, passes, profiles["tuned" if args.autotune else args.pacing],
+                                corrections=args.verify)
+        print("%s: %d events %s, %.1f s, fidelity %.3f, %d dropped"
+              % (path, report.events, report.events_by_type, report.elapsed, report.fidelity, report.dropped))
+        if args.verify:
+            print("  wrong cells, then after each correction pass:",
+                  ", ".join("%.2f %%" % (100 * residual) for residual in progress.pop()))
+        for n, (elapsed, fidelity) in enumerate(progress, 1):
+            print("  pass %d done after %.1f s, fidelity %.3f" % (n, elapsed, fidelity))
+        print("  " + ", ".join("%s %.0f ms" % (name, 1000 * seconds) for name, seconds in metrics.phases.items()))
+        if args.backend != "virtual":
+            canvas = VirtualCanvas()  # only for its screen layout
+            layout = (canvas.canvas_top_left, canvas.colors_top_left)
+            if args.backend == "devtools":
+                chrome.driver.refresh()
+                backend = backends.DevToolsBackend(chrome.driver, args.trusted)
+                layout = backend.layout()[:2]
+            elif args.backend == "pynput":
+                backend = backends.PynputBackend()
+            else:
+                backend = backends.XTestBackend()
+            with metrics.phase("draw"):
+                Drawer(backend, *layout, pacing={}, metrics=metrics).draw(plan)
+                backend.flush()
+            print("%s with %s: %s" % (path, args.backend, metrics.status()))
+            print("  events per second:", metrics.summary()["events_per_second"])
+            if args.backend == "devtools":
+                print("  sent %d events, the page received %s" % (backend.sent, chrome.driver.execute_script(
+                    "return window.received;")))
+    if chrome is not None:
+        chrome.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+GOOGLE_IMAGES_URL = "https://www.google.com/search?safe=off&site=&tbm=isch&source=hp&q={q}&oq={q}&gs_l=img"
+SKRIBBL_URL = "https://skribbl.io/"
+THUMBNAIL_SELECTOR = "img.Q4LuWd"
+FULL_IMAGE_SELECTOR = "img.n3VNCb"
+
+
+class ChromeSession:
+    """One Chrome controlled through chromedriver, started in the background and reused."""
+
+    headless = True
+
+    def __init__(self, executable_path):
+        self.executable_path = executable_path
+        self._driver = None
+        self._error = None
+        self._ready = threading.Event()
+        self._starting = None
+
+    def _launch(self):
+        try:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+            options = Options()
+            if self.headless:
+                options.add_argument("--headless")
+                options.add_argument("--window-size=1920,1080")
+            driver = webdriver.Chrome(executable_path=self.executable_path, options=options)
+            self._started(driver)
+            self._driver = driver
+        except Exception as e:
+            self._error = e
+        self._ready.set()
+
+    def _started(self, driver):
+        """Called in the launching thread once Chrome runs."""
+
+    def start(self):
+        """Launches the browser in the background unless it is running or starting already."""
+        if self._starting is None:
+            self._starting = threading.Thread(target=self._launch, daemon=True)
+            self._starting.start()
+
+    @property
+    def driver(self):
+        self.start()
+        self._ready.wait()
+        if self._driver is None:
+            raise RuntimeError("could not start Chrome: %s" % self._error)
+        return self._driver
+
+    def quit(self):
+        if self._starting is None:
+            return
+        self._ready.wait()
+        if self._driver is not None:
+            self._driver.quit()
+        self._driver = None
+        self._starting = None
+        self._ready.clear()
+
+
+class GameBrowser(ChromeSession):
+    """A visible Chrome with the game, for drawing through backends.DevToolsBackend.
+
+    The game is played in this window like in any other, only the drawing goes straight to the page.
+    """
+
+    headless = False
+
+    def __init__(self, executable_path, url=SKRIBBL_URL):
+        super().__init__(executable_path)
+        self.url = url
+
+    def _started(self, driver):
+        driver.get(self.url)
+
+
+class ImageSearchBrowser(ChromeSession):
+    """One headless Chrome that is started in the background and reused for every image search.
+
+    `search_url` is formatted with the query as q, so a stand-in results page on disk (a file:// URL with
+    the same thumbnail and full image elements) can replace Google for testing.
+    """
+
+    def __init__(self, executable_path, search_url=GOOGLE_IMAGES_URL, timeout=5.0):
+        super().__init__(executable_path)
+        self.search_url = search_url
+        self.timeout = timeout
+        self._lock = threading.Lock()  # one query at a time
+
+    def fetch_image_urls(self, query: str, count: int,
+                         progress: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """Collects the URLs of up to `count` full size images by clicking through the thumbnails.
+
+        Instead of sleeping, it waits for new thumbnails after scrolling and for a new full image after
+        every click, `timeout` seconds at most.
+        """
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self._lock:
+            start = time.perf_counter()
+            wd = self.driver
+            wd.get(self.search_url.format(q=query))
+            wait = WebDriverWait(wd, self.timeout)
+
+            def full_image_urls(wd):
+                return {img.get_attribute("src") for img in wd.find_elements_by_css_selector(FULL_IMAGE_SELECTOR)
+                        if img.get_attribute("src") and "http" in img.get_attribute("src")}
+
+            image_urls = []
+            results_start = 0
+            while len(image_urls) < count:
+                wd.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                try:
+                    wait.until(lambda wd: len(wd.find_elements_by_css_selector(THUMBNAIL_SELECTOR)) > results_start)
+                except TimeoutException:
+                    break  # no more results
+                thumbnail_results = wd.find_elements_by_css_selector(THUMBNAIL_SELECTOR)
+                log.info("found %d search results, extracting links from %d on",
+                         len(thumbnail_results), results_start)
+                for img in thumbnail_results[results_start:]:
+                    if progress:
+                        progress(len(image_urls) + 1, count)
+                    # click every thumbnail to get the real image behind it
+                    try:
+                        img.click()
+                        new = wait.until(lambda wd: full_image_urls(wd) - set(image_urls))
+                    except (TimeoutException, WebDriverException):
+                        continue
+                    image_urls.extend(sorted(new))
+                    if len(image_urls) >= count:
+                        break
+                results_start = len(thumbnail_results)
+            log.info("grabbed %d image links for %r in %.1f s", len(image_urls), query, time.perf_counter() - start)
+            return image_urls[:count]
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image
+
+import ordering
+import pacing
+import planner
+from backends import VirtualCanvas
+from drawing import Drawer
+from planner import ColorStrokes
+
+log = logging.getLogger(__name__)
+
+TIMING_LOG = os.path.join(os.path.expanduser("~"), ".cache", "autoskribbler", "timing.jsonl")
+
+CELL_SIZES = (6, 8, 10, 12, 16)  # grid resolutions to choose from, in canvas pixels per pixel, finest first
+CANVAS_SIZE = (planner.DRAW_SIZE[0] * planner.CELL_SIZE, planner.DRAW_SIZE[1] * planner.CELL_SIZE)
+
+
+class CostModel(NamedTuple):
+    """How long the Drawer takes for a plan on a backend, counting every event it sends."""
+    latency: float = 0.001  # seconds the backend needs to send one event
+    gaps: Dict[str, float] = pacing.PROFILES["legacy"]  # the pacing profile the Drawer keeps
+    travel: float = 0.0  # seconds per canvas pixel the cursor jumps between strokes
+
+    def stroke(self, points) -> float:
+        """Moving to the stroke and clicking, or pressing, dragging through the other points and releasing."""
+        gap = self.gaps.get
+        if points == 1:
+            return 2 * self.latency + gap("move", 0) + gap("click", 0)
+        return (points + 2) * self.latency + points * gap("move", 0) + gap("press", 0) + gap("release", 0)
+
+    def switch(self, kind) -> float:
+        """Clicking a palette button: two moves, press and release, then the gap for the color, tool or brush."""
+        gap = self.gaps.get
+        return 4 * self.latency + 2 * gap("move", 0) + gap("press", 0) + gap(kind, 0)
+
+    def switch_events(self) -> int:
+        """How many stroke moves take as long as picking a color and a brush, for plan_brush_sizes."""
+        move = self.latency + self.gaps.get("move", 0)
+        return max(planner.SWITCH_EVENTS, round((self.switch("color") + self.switch("brush")) / move))
+
+    def costs(self, plan: List[ColorStrokes], cell=planner.CELL_SIZE) -> List[Tuple[float, List[float]]]:
+        """Per pass of the plan: the time for its palette clicks and for each of its strokes."""
+        costs = []
+        tool, size = None, None
+        for color in plan:
+            switches = self.switch("color")
+            if color.tool != tool:
+                tool = color.tool
+                switches += self.switch("tool")
+            if color.size is not None and color.size != size:
+                size = color.size
+                switches += self.switch("brush")
+            strokes, end = [], None
+            for stroke in color.strokes:
+                jump = 0.0 if end is None else float(np.hypot(*(stroke[0] - end))) * cell
+                strokes.append(self.stroke(len(stroke)) + self.travel * jump)
+                end = stroke[-1]
+            costs.append((switches, strokes))
+        return costs
+
+    def predict(self, plan: List[ColorStrokes], cell=planner.CELL_SIZE) -> float:
+        return sum(switches + sum(strokes) for switches, strokes in self.costs(plan, cell))
+
+    def truncate(self, plan: List[ColorStrokes], seconds, cell=planner.CELL_SIZE) -> List[ColorStrokes]:
+        """The longest beginning of the plan that is done within `seconds`."""
+        truncated = []
+        for color, (switches, strokes) in zip(plan, self.costs(plan, cell)):
+            seconds -= switches
+            kept = 0
+            while kept < len(strokes) and strokes[kept] <= seconds:
+                seconds -= strokes[kept]
+                kept += 1
+            if kept:
+                truncated.append(color._replace(strokes=color.strokes[:kept]))
+            if kept < len(strokes):
+                break
+        return truncated
+
+
+def count_events(plan: List[ColorStrokes]) -> int:
+    """Mouse events the Drawer sends for a plan, the way CostModel counts them."""
+    events = 0
+    tool, size = None, None
+    for color in plan:
+        events += 4  # the color button: two moves, press and release
+        if color.tool != tool:
+            tool = color.tool
+            events += 4
+        if color.size is not None and color.size != size:
+            size = color.size
+            events += 4
+        # a single point is a move and a click, a drag is pressed and released around its moves
+        events += sum(2 if len(stroke) == 1 else len(stroke) + 2 for stroke in color.strokes)
+    return events
+
+
+def _ordered(plan: List[ColorStrokes]) -> List[ColorStrokes]:
+    return [ordering.order_color_strokes(color) for color in plan]
+
+
+def _drawn(cell) -> Tuple[VirtualCanvas, Drawer]:
+    """A blank VirtualCanvas and an unpaced Drawer for plans of `cell`, to see what a plan paints."""
+    canvas = VirtualCanvas(canvas_size=CANVAS_SIZE)
+    return canvas, Drawer(canvas, canvas.canvas_top_left, canvas.colors_top_left, cell, pacing={})
+
+
+def plan_within_budget(img: Image, seconds, model: CostModel, sizes=planner.BRUSH_SIZES, cells=CELL_SIZES,
+                       dither="floyd-steinberg", metric="rgb") -> Tuple[List[ColorStrokes], int, float]:
+    """Picks the grid resolution that gets closest to the image while the drawing fits into `seconds`.
+
+    Every cell size gets an ordered plan_brush_sizes plan. How close a plan gets is the fidelity of
+    drawing it onto a VirtualCanvas, measured against the finest grid, so that what the brushes paint
+    beyond or short of the coarser pixels counts as well as the pixels themselves. The progressive plan
+    of the coarsest grid competes as well, cut off after whichever of its colors that still fits leaves
+    the canvas closest to the image: it keeps a rough version of the picture when no plan fits, and as
+    every plan that fits a budget fits a bigger one, the picked fidelity never falls as the budget
+    grows. Returns the plan, its cell size and the predicted seconds.
+    """
+    reference = None
+    best = None  # (fidelity, plan, cell, predicted)
+    for cell in cells:
+        size = (round(CANVAS_SIZE[0] / cell), round(CANVAS_SIZE[1] / cell))
+        idx = planner.quantize(img, size, dither=dither, metric=metric)
+        if reference is None:
+            reference = idx
+        plan = _ordered(planner.plan_brush_sizes(idx, sizes, cell, switch=model.switch_events()))
+        predicted = model.predict(plan, cell)
+        if predicted > seconds:
+            continue
+        canvas, drawer = _drawn(cell)
+        drawer.draw(plan)
+        fidelity = canvas.fidelity(reference, cells[0])
+        if best is None or fidelity > best[0]:
+            best = (fidelity, plan, cell, predicted)
+
+    passes = planner.plan_progressive(idx, sizes=sizes, cell=cell, switch=model.switch_events())
+    plan = model.truncate([color for colors in passes for color in _ordered(colors)], seconds, cell)
+    canvas, drawer = _drawn(cell)
+    kept = 0
+    fidelity = canvas.fidelity(reference, cells[0])
+    for i, color in enumerate(plan, 1):
+        drawer.draw([color])
+        if canvas.fidelity(reference, cells[0]) > fidelity:
+            kept, fidelity = i, canvas.fidelity(reference, cells[0])
+    if best is None or fidelity > best[0]:
+        best = (fidelity, plan[:kept], cell, model.predict(plan[:kept], cell))
+    return best[1:]
+
+
+def log_run(plan: List[ColorStrokes], model: CostModel, predicted, actual, path=TIMING_LOG):
+    """Records how long a drawing took next to what the model predicted, so that the model can be checked."""
+    events = count_events(plan)
+    paced = model._replace(latency=0.0).predict(plan)
+    log.info("predicted %.1f s, took %.1f s", predicted, actual)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as file:
+        file.write(json.dumps({"time": time.time(), "events": events, "paced": paced,
+                               "predicted": predicted, "actual": actual}) + "\n")
+
+
+def fit_latency(path=TIMING_LOG, runs=20, default=0.001) -> float:
+    """The per-event latency that explains the last logged runs best, for a CostModel of the real backend."""
+    try:
+        with open(path) as file:
+            entries = [json.loads(line) for line in file.readlines()[-runs:]]
+    except (OSError, ValueError):
+        return default
+    events = sum(entry["events"] for entry in entries)
+    if not events:
+        return default
+    return max(sum(entry["actual"] - entry["paced"] for entry in entries) / events, 0.0)
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import drawing
+import planner
+
+log = logging.getLogger(__name__)
+
+CALIBRATION_FILE = os.path.join(os.path.expanduser("~"), ".cache", "autoskribbler", "calibration.json")
+
+CANVAS_SIZE = (800, 600)  # skribbl's canvas in page pixels
+TOLERANCE = 8  # how far a screen color may be off from the palette color in any channel
+ROW_STEP = 4  # screen rows searched for the palette, buttons are taller than that even zoomed out
+MIN_RUN = 3  # shorter runs of a palette color are where a zoomed screen blurs two buttons into a third color
+
+
+class Calibration(NamedTuple):
+    """Where the game is on the screen and how big it is shown there."""
+    canvas_top_left: Tuple[int, int]
+    colors_top_left: Tuple[int, int]
+    scale: float = 1.0  # screen pixels per page pixel, browser zoom and display scaling together
+
+
+def screenshot() -> Image.Image:
+    from PIL import ImageGrab
+    return ImageGrab.grab()
+
+
+def _matches(rgb: np.ndarray, color, tolerance) -> np.ndarray:
+    return (np.abs(rgb - np.array(color, dtype=np.int16)) <= tolerance).all(axis=2)
+
+
+def _runs(row: np.ndarray):
+    """(value, start, end) of the runs of equal values in a row, end exclusive."""
+    starts = np.flatnonzero(np.diff(row, prepend=row[0] - 1))
+    ends = np.append(starts[1:], len(row))
+    return zip(row[starts].tolist(), starts.tolist(), ends.tolist())
+
+
+def _palette_fits(rgb: np.ndarray, colors_top_left, scale, tolerance) -> bool:
+    """Whether the center of every color button has its palette color."""
+    height, width = rgb.shape[:2]
+    for (dx, dy), color in zip(drawing.COLOR_OFFSETS, planner.PALETTE):
+        x, y = round(colors_top_left[0] + dx * scale), round(colors_top_left[1] + dy * scale)
+        if not (0 <= x < width and 0 <= y < height) or \
+                np.abs(rgb[y, x] - np.array(color)).max() > tolerance:
+            return False
+    return True
+
+
+def find_palette(rgb: np.ndarray, tolerance=TOLERANCE) -> Optional[Tuple[Tuple[int, int], float]]:
+    """Finds the color buttons: the top left of the palette and the scale it is shown at.
+
+    The top row of buttons is looked for in every ROW_STEP-th screen row as ten runs of equal length in
+    the order of PALETTE: all eleven buttons but the white one, which may merge with whatever is next to it.
+    The distance between their centers gives the scale, and the palette is placed by the center of the
+    first of them, as zooming blurs the edges of the buttons. All 22 buttons have to match.
+    """
+    rows = rgb[::ROW_STEP]
+    row_colors = np.full(rows.shape[:2], -1, dtype=np.int8)
+    for i in range(1, 11):
+        row_colors[_matches(rows, planner.PALETTE[i], tolerance)] = i
+    candidates = np.flatnonzero(np.all([(row_colors == i).any(axis=1) for i in range(1, 11)], axis=0))
+    for row in candidates.tolist():
+        runs = [run for run in _runs(row_colors[row]) if run[0] > 0 and run[2] - run[1] >= MIN_RUN]
+        for k in range(len(runs) - 9):
+            sequence = runs[k:k + 10]
+            if [value for value, _, _ in sequence] != list(range(1, 11)):
+                continue
+            lengths = [end - start for _, start, end in sequence]
+            if max(lengths) - min(lengths) > 2:
+                continue
+            first, last = (sequence[0][1] + sequence[0][2] - 1) / 2, (sequence[-1][1] + sequence[-1][2] - 1) / 2
+            button = (last - first) / 9
+            scale = button / drawing.COLOR_BUTTON_SIZE
+            column = _matches(rgb[:, round(first):round(first) + 1], planner.PALETTE[1], tolerance)[:, 0]
+            top = bottom = row * ROW_STEP
+            while top > 0 and column[top - 1]:
+                top -= 1
+            while bottom + 1 < len(column) and column[bottom + 1]:
+                bottom += 1
+            # centers of pixels are half a pixel in, of buttons half a button
+            colors_top_left = (round(first - (button - 1) / 2 - button), round((top + bottom) / 2 - (button - 1) / 2))
+            if _palette_fits(rgb, colors_top_left, scale, tolerance):
+                return colors_top_left, scale
+    return None
+
+
+def find_canvas(rgb: np.ndarray, scale=1.0, tolerance=TOLERANCE) -> Optional[Tuple[int, int]]:
+    """Finds the top left of the empty canvas: the tallest stack of white rows as wide as the canvas at `scale`.
+
+    The white may fall short of that by a percent, as far as the scale found for the palette can be off,
+    and by the pixel on every side that a zoomed screen blurs into the page around the canvas.
+    """
+    width, height = round(CANVAS_SIZE[0] * scale), round(CANVAS_SIZE[1] * scale)
+    white = np.pad(_matches(rgb, planner.PALETTE[planner.WHITE], tolerance), ((0, 0), (1, 1)))
+    edges = np.diff(white.astype(np.int8), axis=1)
+    ys, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)  # row major like the starts, so every run's start and end pair up
+    wide = ends - starts >= width - width // 100 - 2
+    ys, starts = ys[wide], starts[wide]
+    best = None  # (rows, left, top)
+    order = np.lexsort((ys, starts))
+    top = None
+    for i, j in zip(order.tolist(), order[1:].tolist() + [None]):
+        top = ys[i] if top is None else top
+        if j is None or starts[j] != starts[i] or ys[j] != ys[i] + 1:
+            rows = ys[i] - top + 1
+            if best is None or rows > best[0]:
+                best = (rows, int(starts[i]), int(top))
+            top = None
+    if best is None or best[0] < height - height // 100 - 2:
+        return None
+    return best[1], best[2]
+
+
+def calibrate(img: Image.Image, tolerance=TOLERANCE) -> Optional[Calibration]:
+    """Finds the palette and the canvas on a screenshot, or returns None if either is not there.
+
+    The canvas has to be empty. The offsets of the tool and brush buttons (see drawing.py) are taken from
+    the page layout and scaled like the color buttons.
+    """
+    rgb = np.asarray(img.convert("RGB"), dtype=np.int16)
+    palette = find_palette(rgb, tolerance)
+    if palette is None:
+        log.info("no palette on the screen")
+        return None
+    colors_top_left, scale = palette
+    canvas_top_left = find_canvas(rgb, scale, tolerance)
+    if canvas_top_left is None:
+        log.info("no empty canvas on the screen")
+        return None
+    return Calibration(canvas_top_left, colors_top_left, scale)
+
+
+def _layout(img: Image.Image) -> str:
+    return "%dx%d" % img.size
+
+
+def auto_calibrate(img: Optional[Image.Image] = None, path=CALIBRATION_FILE) -> Optional[Calibration]:
+    """Calibrates from a screenshot (a new one if `img` is None), reusing what was found for the same screen.
+
+    Results are cached by screen size. A cached calibration is used as long as the palette is still where
+    it says; otherwise the screenshot is searched again.
+    """
+    start = time.perf_counter()
+    img = img or screenshot()
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.get(_layout(img))
+    if entry is not None:
+        calibration = Calibration(tuple(entry["canvas_top_left"]), tuple(entry["colors_top_left"]), entry["scale"])
+        rgb = np.asarray(img.convert("RGB"), dtype=np.int16)
+        if _palette_fits(rgb, calibration.colors_top_left, calibration.scale, TOLERANCE):
+            log.info("using the calibration of this screen from before")
+            return calibration
+    calibration = calibrate(img)
+    if calibration is None:
+        return None
+    log.info("calibrated in %.2f s: canvas at %s, palette at %s, %.2f screen pixels per page pixel",
+             time.perf_counter() - start, calibration.canvas_top_left, calibration.colors_top_left,
+             calibration.scale)
+    cache[_layout(img)] = calibration._asdict()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(cache, file)
+    return calibration
@@ -0,0 +1,130 @@
+"""Runs the calibration on synthetic screenshots of the game shown at several zoom levels.
+
+Every screen is the simulated page of backends.VirtualCanvas, scaled like a browser zoom would and put
+somewhere on a bigger screen. Checks what find_palette, find_canvas and calibrate return on it, that
+a canvas with a drawing on it or a screen without the palette is not taken for the game, and that
+auto_calibrate reuses what it found for a screen until the palette moves. Prints every check next to
+what it should give. Exits with 1 if any of them did not come out as expected.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import calibration
+import planner
+from backends import PAGE_COLOR, VirtualCanvas
+from drawing import Drawer
+
+SCREEN_SIZE = (2560, 2000)
+CANVAS_TOP_LEFT = (30, 20)  # where the page puts the canvas and the palette, in page pixels
+COLORS_TOP_LEFT = (30, 640)
+PAGE_SIZE = (860, 700)
+
+
+class Records(logging.Handler):
+    """Keeps the messages of the calibration log, to tell a cached calibration from a new one."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def screen(scale, offset, resample=Image.BICUBIC, drawn=False, palette=True) -> Image.Image:
+    """The page at `scale`, its top left at `offset` on a screen of SCREEN_SIZE."""
+    page = VirtualCanvas(CANVAS_TOP_LEFT, COLORS_TOP_LEFT)
+    if drawn:
+        Drawer(page, page.canvas_top_left, page.colors_top_left, pacing={}).draw(
+            [planner.ColorStrokes(color=planner.BLACK, strokes=[np.array([[20, 20], [110, 80]], dtype=np.float32)])])
+    img = page.grab((0, 0) + PAGE_SIZE)
+    if not palette:
+        img.paste(PAGE_COLOR, (0, COLORS_TOP_LEFT[1], PAGE_SIZE[0], PAGE_SIZE[1]))
+    img = img.resize((round(PAGE_SIZE[0] * scale), round(PAGE_SIZE[1] * scale)), resample)
+    full = Image.new("RGB", SCREEN_SIZE, PAGE_COLOR)
+    full.paste(img, offset)
+    return full
+
+
+def expected(scale, offset) -> calibration.Calibration:
+    return calibration.Calibration((round(offset[0] + CANVAS_TOP_LEFT[0] * scale),
+                                    round(offset[1] + CANVAS_TOP_LEFT[1] * scale)),
+                                   (round(offset[0] + COLORS_TOP_LEFT[0] * scale),
+                                    round(offset[1] + COLORS_TOP_LEFT[1] * scale)), scale)
+
+
+def close(got, want) -> bool:
+    """Positions within a screen pixel and the scale within a percent, as zooming blurs the edges."""
+    if got is None or want is None:
+        return got is want
+    return all(abs(a - b) <= 1 for a, b in zip(got.canvas_top_left + got.colors_top_left,
+                                               want.canvas_top_left + want.colors_top_left)) \
+        and abs(got.scale - want.scale) <= 0.01 * want.scale
+
+
+def describe(result) -> str:
+    if result is None:
+        return "none"
+    return "canvas %s, palette %s, scale %.3f" % (result.canvas_top_left, result.colors_top_left, result.scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.67, 0.8, 1.0, 1.25, 1.5, 2.0, 2.5])
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    wrong = 0
+
+    def check(name, got, want):
+        nonlocal wrong
+        ok = close(got, want)
+        wrong += not ok
+        print("%-34s %-4s %s" % (name, "ok" if ok else "FAIL", describe(got)))
+        if not ok:
+            print("%-34s      expected %s" % ("", describe(want)))
+
+    for scale in args.scales:
+        for resample, method in ((Image.NEAREST, "nearest"), (Image.BICUBIC, "bicubic")):
+            offset = (round(97 * scale), round(61 * scale) + 13)
+            img = screen(scale, offset, resample)
+            rgb = np.asarray(img, dtype=np.int16)
+            want = expected(scale, offset)
+            start = time.perf_counter()
+            palette = calibration.find_palette(rgb)
+            canvas = calibration.find_canvas(rgb, palette[1]) if palette is not None else None
+            found = calibration.Calibration(canvas, *palette) if palette and canvas else None
+            check("x%.2f %s (%.2f s)" % (scale, method, time.perf_counter() - start), found, want)
+            check("x%.2f %s calibrate" % (scale, method), calibration.calibrate(img), want)
+        check("x%.2f drawn on" % scale, calibration.calibrate(screen(scale, (5, 5), drawn=True)), None)
+        check("x%.2f no palette" % scale, calibration.calibrate(screen(scale, (5, 5), palette=False)), None)
+
+    records = Records()
+    logging.getLogger(calibration.__name__).addHandler(records)
+    logging.getLogger(calibration.__name__).setLevel(logging.INFO)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "calibration.json")
+        for name, scale, offset, cached in (("auto: first time", 1.25, (40, 30), False),
+                                            ("auto: same screen", 1.25, (40, 30), True),
+                                            ("auto: window moved", 1.25, (300, 120), False),
+                                            ("auto: zoomed in", 1.5, (300, 120), False),
+                                            ("auto: same again", 1.5, (300, 120), True)):
+            del records.messages[:]
+            got = calibration.auto_calibrate(screen(scale, offset), path=path)
+            reused = any("from before" in message for message in records.messages)
+            check("%s (%s)" % (name, "cached" if reused else "searched"), got,
+                  expected(scale, offset) if reused == cached else None)
+    print("%d checks not as expected" % wrong)
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Runs the thumbnail downloads against a local HTTP server with slow, trickling, failing and redirecting endpoints.
+
+Prints what every URL gave and when, next to what it should give, and how many connections the
+server saw for how many requests. Then stops a batch of slow downloads early on and prints how soon
+they ended. Exits with 1 if any URL did not come out as expected or the stop was not heeded.
+"""
+import argparse
+import http.server
+import logging
+import sys
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+import downloads
+
+
+def _image(fmt, size) -> bytes:
+    data = BytesIO()
+    Image.new("RGB", size, (239, 19, 11)).save(data, fmt)
+    return data.getvalue()
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # downloads hang up on the slow endpoints on purpose
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """The endpoints, by path. Keeps connections alive and counts them."""
+
+    protocol_version = "HTTP/1.1"
+    jpeg = _image("JPEG", (2000, 1500))
+    png = _image("PNG", (640, 480))
+    connections = set()
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: bytes, status=200, content_type="image/jpeg"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.lock:
+            StandInHandler.connections.add(self.client_address)
+            StandInHandler.requests += 1
+        timeout = self.server.timeout_seconds
+        path = self.path.split("?")[0]
+        if path == "/ok.jpg":
+            self._send(self.jpeg)
+        elif path == "/ok.png":
+            self._send(self.png, content_type="image/png")
+        elif path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/ok.jpg")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/fail":
+            self._send(b"internal error", 500, "text/plain")
+        elif path == "/text":
+            self._send(b"<html>not an image</html>", content_type="text/html")
+        elif path == "/slow":
+            # answers only after the download has timed out
+            time.sleep(timeout * 1.5)
+            self._send(self.jpeg)
+        elif path == "/trickle":
+            # a little data every now and then, which keeps the socket busy past the timeout
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(self.jpeg)))
+            self.end_headers()
+            for start in range(0, len(self.jpeg), 100):
+                self.wfile.write(self.jpeg[start:start + 100])
+                self.wfile.flush()
+                time.sleep(timeout / 8)
+        elif path.startswith("/late"):
+            # fine on its own, but the last of them only get their turn after the deadline
+            time.sleep(timeout * 0.75)
+            self._send(self.jpeg)
+        else:
+            self._send(b"not found", 404, "text/plain")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds for every download")
+    parser.add_argument("--verbose", action="store_true", help="log every failed download")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.ERROR)
+
+    server = StandInServer(("127.0.0.1", 0), StandInHandler)
+    server.timeout_seconds = args.timeout
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:%d" % server.server_address[1]
+
+    # with two of the four workers busy on slow and trickle until the timeout, two of the late ones
+    # finish in time and the others only after the deadline
+    expected = {"/ok.jpg": "ok", "/ok.png": "ok", "/redirect": "ok", "/fail": "failed", "/text": "failed",
+                "/slow": "failed", "/trickle": "failed", "/late?1": "ok", "/late?2": "ok",
+                "/late?3": "dropped", "/late?4": "dropped"}
+    deadline = args.timeout * 1.25
+    urls = [base + path for path in expected]
+    results = {}
+    start = time.perf_counter()
+    for url, img in downloads.fetch_thumbnails(urls, workers=4, timeout=args.timeout, deadline=deadline):
+        results[url] = ("ok" if img is not None else "failed", time.perf_counter() - start, img)
+    elapsed = time.perf_counter() - start
+
+    wrong = 0
+    for path, expectation in expected.items():
+        got, seconds, img = results.get(base + path, ("dropped", None, None))
+        wrong += got != expectation
+        print("%-10s %-8s %-8s %s%s" % (path, expectation, got, "" if seconds is None else "%.2f s" % seconds,
+                                        "" if img is None else ", %dx%d" % img.size))
+    print("%d URLs in %.2f s (deadline %.2f s), %d connections for %d requests, %d not as expected"
+          % (len(urls), elapsed, deadline, len(StandInHandler.connections), StandInHandler.requests, wrong))
+
+    # stopped while every worker waits for a slow answer: nothing may come after the stop, and it has
+    # to end right away instead of when the next download is done
+    stop = threading.Event()
+    stop_after = args.timeout / 4
+    threading.Timer(stop_after, stop.set).start()
+    urls = [base + path for path in ("/slow", "/trickle", "/late?5", "/late?6", "/late?7", "/ok.jpg")]
+    start = time.perf_counter()
+    late = 0
+    for url, img in downloads.fetch_thumbnails(urls, workers=4, timeout=args.timeout, deadline=deadline, stop=stop):
+        late += stop.is_set()
+    elapsed = time.perf_counter() - start
+    stopped_late = late or elapsed > stop_after + 4 * downloads.STOP_POLL
+    wrong += stopped_late
+    print("stopped after %.2f s, ended after %.2f s, %d yielded after the stop%s"
+          % (stop_after, elapsed, late, ", not as expected" if stopped_late else ""))
+    server.shutdown()
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Runs image searches in the managed Chrome against a stand-in results page on disk instead of Google.
+
+The page has the thumbnail and full image elements browser.ImageSearchBrowser looks for: thumbnails
+come in pages when scrolled to the bottom, and a click shows its full image after a delay, so both
+waits are exercised. Prints the time Chrome took to start, the grab latency of every query and how
+long the teardown took. Exits with 1 if a query did not get all its links.
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from browser import FULL_IMAGE_SELECTOR, THUMBNAIL_SELECTOR, ImageSearchBrowser
+
+STANDIN_RESULTS_PAGE = """<!DOCTYPE html>
+<html><body style="margin: 0">
+<div id="results"></div>
+<img class="%(full)s" style="position: fixed; right: 0; top: 0; width: 300px; height: 300px">
+<script>
+const query = new URLSearchParams(location.search).get("q") || "";
+const results = document.getElementById("results");
+const full = document.querySelector("img.%(full)s");
+let shown = 0;
+function more() {
+    for (const end = Math.min(shown + %(page)d, %(total)d); shown < end; shown++) {
+        const thumbnail = document.createElement("img");
+        thumbnail.className = "%(thumbnail)s";
+        thumbnail.style = "display: block; width: 150px; height: 150px; margin: 4px; background: #c1c1c1";
+        const i = shown;
+        thumbnail.onclick = () => setTimeout(() => {
+            full.src = "http://127.0.0.1:9/" + encodeURIComponent(query) + "/" + i + ".jpg";
+        }, %(delay)d);
+        results.appendChild(thumbnail);
+    }
+}
+more();
+window.addEventListener("scroll", () => setTimeout(more, %(delay)d));
+</script>
+</body></html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", default=["cat", "house", "tree"])
+    parser.add_argument("--chromedriver", default="./chromedriver")
+    parser.add_argument("--count", type=int, default=9, help="image links to grab per query")
+    parser.add_argument("--page", type=int, default=6, help="thumbnails the page adds per scroll")
+    parser.add_argument("--delay", type=int, default=200, help="milliseconds the page takes to react")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, "results.html")
+        path.write_text(STANDIN_RESULTS_PAGE % dict(full=FULL_IMAGE_SELECTOR.split(".")[1],
+                                                    thumbnail=THUMBNAIL_SELECTOR.split(".")[1],
+                                                    page=args.page, total=args.count * 3, delay=args.delay))
+        browser = ImageSearchBrowser(args.chromedriver, search_url=path.as_uri() + "?q={q}",
+                                     timeout=args.delay / 1000 * 5)
+        start = time.perf_counter()
+        browser.start()
+        browser.driver  # waits for Chrome
+        print("Chrome started in %.2f s" % (time.perf_counter() - start))
+        short = 0
+        for query in args.queries:
+            start = time.perf_counter()
+            urls = browser.fetch_image_urls(query, args.count)
+            short += len(urls) < args.count
+            print("%-12s %d/%d links in %.2f s" % (query, len(urls), args.count, time.perf_counter() - start))
+        start = time.perf_counter()
+        browser.quit()
+        print("quit in %.2f s, %d queries short of links" % (time.perf_counter() - start, short))
+    sys.exit(1 if short else 0)
+
+
+if __name__ == "__main__":
+    main()
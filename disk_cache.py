@@ -0,0 +1,38 @@
+import os
+import threading
+
+
+def write_atomically(path, write):
+    """Calls `write` with a temporary file name and moves the file into place once it is complete.
+
+    The temporary name is unique per process and thread, so writers of the same entry don't collide.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    write(temporary)
+    os.replace(temporary, path)
+
+
+def evict(directory, max_bytes, extensions):
+    """Removes the least recently used files with the given extensions until the rest fit into max_bytes.
+
+    The modification time counts as the last use. Several processes may share a cache (see plan_batch.py),
+    so files can vanish under our feet.
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(extensions):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        total -= size
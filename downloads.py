@@ -0,0 +1,142 @@
+import http.client
+import logging
+import threading
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+from typing import Iterable, Iterator, Optional, Tuple
+
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Accept": "image/*", "Connection": "keep-alive"}
+THUMBNAIL_SIZE = (200, 200)
+STOP_POLL = 0.1  # seconds between looks at the stop event while waiting for downloads
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _Connections(threading.local):
+    """One kept-alive connection per host and worker thread."""
+
+    def __init__(self):
+        self.connections = {}
+
+    def get(self, scheme, host, timeout) -> http.client.HTTPConnection:
+        connection = self.connections.get((scheme, host))
+        if connection is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            connection = self.connections[scheme, host] = cls(host, timeout=timeout)
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def drop(self, scheme, host):
+        connection = self.connections.pop((scheme, host), None)
+        if connection is not None:
+            connection.close()
+
+
+_connections = _Connections()
+
+
+def fetch(url, timeout=5.0, max_bytes=20 * 1024 * 1024, redirects=5,
+          stop: Optional[threading.Event] = None) -> bytes:
+    """Downloads a URL in at most `timeout` seconds, reusing the worker's connection to the host.
+
+    Gives up between two chunks of the response once `stop` is set.
+    """
+    deadline = time.monotonic() + timeout
+    for _ in range(redirects + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise DownloadError("unsupported URL " + url)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DownloadError("timed out")
+        connection = _connections.get(parts.scheme, parts.netloc, remaining)
+        try:
+            connection.request("GET", path, headers=HEADERS)
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                continue
+            if response.status != 200:
+                response.read()
+                raise DownloadError("HTTP %d" % response.status)
+            chunks, size = [], 0
+            while True:
+                if time.monotonic() > deadline:
+                    raise DownloadError("timed out")
+                if stop is not None and stop.is_set():
+                    raise DownloadError("stopped")
+                chunk = response.read1(64 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError("too large")
+                chunks.append(chunk)
+            response.read()  # marks the response as done, so that the connection can be used again
+            if response.will_close:
+                _connections.drop(parts.scheme, parts.netloc)
+            return b"".join(chunks)
+        except (OSError, http.client.HTTPException, DownloadError):
+            # the connection may be in any state now, the next request opens a new one
+            _connections.drop(parts.scheme, parts.netloc)
+            raise
+    raise DownloadError("too many redirects")
+
+
+def decode_thumbnail(data: bytes, size=THUMBNAIL_SIZE) -> Image:
+    img = Image.open(BytesIO(data))
+    img.draft("RGB", size)  # JPEGs get decoded at a fraction of their size right away
+    img.thumbnail(size, Image.NEAREST)
+    return img.convert("RGB")
+
+
+def _thumbnail(url, size, timeout, stop) -> Image:
+    return decode_thumbnail(fetch(url, timeout, stop=stop), size)
+
+
+def fetch_thumbnails(urls: Iterable[str], size=THUMBNAIL_SIZE, workers=8, timeout=5.0, deadline=20.0,
+                     stop: Optional[threading.Event] = None) -> Iterator[Tuple[str, Optional[Image.Image]]]:
+    """Downloads and shrinks images in a pool of workers and yields (url, image) as they complete.
+
+    Every download gets `timeout` seconds, all of them together `deadline` seconds; whatever is not done
+    by then is dropped. Failed downloads are reported and yield None as the image. Once `stop` is set,
+    nothing more is yielded, queued downloads are cancelled and running ones give up at their next chunk.
+    """
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {pool.submit(_thumbnail, url, size, timeout, stop): url for url in urls}
+    pending = set(futures)
+    end = time.monotonic() + deadline
+    try:
+        while pending:
+            if stop is not None and stop.is_set():
+                log.info("stopped with %d downloads left", len(pending))
+                return
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                log.warning("giving up on %d downloads", len(pending))
+                return
+            done, pending = wait(pending, min(remaining, STOP_POLL), return_when=FIRST_COMPLETED)
+            for future in done:
+                if stop is not None and stop.is_set():
+                    break
+                url = futures[future]
+                try:
+                    yield url, future.result()
+                except Exception as e:
+                    log.warning("download failed: %s %s", url, e)
+                    yield url, None
+    finally:
+        # running downloads end by their own timeout or the stop event, queued ones are not started anymore
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,135 @@
+import logging
+import threading
+from typing import Iterable, NamedTuple, Optional
+
+import planner
+from pacing import PROFILES, PacedBackend, Pacer
+from planner import ColorStrokes
+
+log = logging.getLogger(__name__)
+
+
+class Checkpoint(NamedTuple):
+    """Where a drawing stopped: the next stroke to draw."""
+    color: int  # index of the pass in the plan
+    stroke: int  # index of the stroke in that pass
+
+# positions of the drawing tools relative to the top left of the color palette
+TOOL_OFFSETS = {
+    "brush": (492, 24),
+    "fill": (540, 24),
+}
+
+# positions of the brush size buttons relative to the top left of the color palette, by brush diameter
+BRUSH_OFFSETS = {
+    4: (300, 24),
+    10: (336, 24),
+    20: (372, 24),
+    40: (408, 24),
+}
+
+# the color buttons are squares of this size, in two rows of eleven
+COLOR_BUTTON_SIZE = 24
+
+# centers of the color buttons relative to the top left of the color palette, by PALETTE index
+COLOR_OFFSETS = [
+    (COLOR_BUTTON_SIZE * (i % 11) + COLOR_BUTTON_SIZE // 2, COLOR_BUTTON_SIZE * (i // 11) + COLOR_BUTTON_SIZE // 2)
+    for i in range(len(planner.PALETTE))
+]
+
+
+class Drawer:
+    """Draws a plan onto the skribbl canvas through an input backend (see backends.py).
+
+    Every event is paced by the minimum gaps in `pacing` (see pacing.py) and counted in `metrics`
+    (see metrics.py), palette clicks also as color, tool and brush switches. `scale` is the number of
+    screen pixels per page pixel (see calibration.py); it stretches the cells and the palette offsets.
+    """
+
+    def __init__(self, mouse, canvas_top_left, colors_top_left, step_size=planner.CELL_SIZE,
+                 pacing=PROFILES["legacy"], metrics=None, scale=1.0):
+        self.pacer = Pacer(pacing, mouse.clock, mouse.sleep)
+        self.mouse = PacedBackend(mouse, self.pacer, metrics)
+        self.metrics = metrics
+        self.canvas_top_left = canvas_top_left
+        self.colors_top_left = colors_top_left
+        self.cell = step_size  # page pixels per cell, what the plan was made for
+        self.step_size = step_size * scale  # screen pixels per cell
+        self.scale = scale
+
+    def draw_stroke(self, points):
+        """Presses at the first cell of the stroke and drags straight through the others."""
+        cX, cY = self.canvas_top_left
+        x, y = points[0]
+        self.mouse.position = (round(cX + x * self.step_size), round(cY + y * self.step_size))
+        if len(points) == 1:
+            self.mouse.click()
+            return
+        self.mouse.press()
+        for x, y in points[1:]:
+            self.mouse.position = (round(cX + x * self.step_size), round(cY + y * self.step_size))
+        self.mouse.release()
+
+    def _press_button(self, offset):
+        self.mouse.move(round(offset[0] * self.scale), round(offset[1] * self.scale))
+        self.mouse.press()
+        self.mouse.release()
+
+    def _switched(self, kind):
+        """After a click on the palette: it needs the pacing gap of a color, tool or brush switch."""
+        self.pacer.mark(kind)
+        if self.metrics is not None:
+            self.metrics.count(kind)
+
+    def set_tool(self, tool):
+        self.mouse.position = self.colors_top_left
+        log.debug("setting tool to %s", tool)
+        self._press_button(TOOL_OFFSETS[tool])
+        self._switched("tool")
+
+    def set_brush(self, size):
+        self.mouse.position = self.colors_top_left
+        log.debug("setting brush size to %d", size)
+        self._press_button(BRUSH_OFFSETS[size])
+        self._switched("brush")
+
+    def set_color(self, color):
+        self.mouse.position = self.colors_top_left
+        log.debug("setting color to %s", planner.PALETTE[color])
+        self._press_button(COLOR_OFFSETS[color])
+        self._switched("color")
+
+    def draw(self, plan: Iterable[ColorStrokes], cancel: Optional[threading.Event] = None,
+             start: Optional[Checkpoint] = None) -> Optional[Checkpoint]:
+        """Draws the colors of a plan as they come, beginning at `start` if the drawing is resumed.
+
+        Once `cancel` is set, it stops before the next stroke and returns where to resume, so nothing that
+        is on the canvas already gets drawn again. Returns None when the whole plan is drawn.
+        """
+        start = start or Checkpoint(0, 0)
+        tool = None
+        size = None
+        debug = log.isEnabledFor(logging.DEBUG)  # checked once, this loop runs for every stroke
+        for i, color in enumerate(plan):
+            if i < start.color:
+                continue
+            strokes = color.strokes[start.stroke:] if i == start.color else color.strokes
+            first = len(color.strokes) - len(strokes)
+            if cancel is not None and cancel.is_set():
+                return Checkpoint(i, first)
+            if color.tool != tool:
+                tool = color.tool
+                self.set_tool(tool)
+            if color.size is not None and color.size != size:
+                size = color.size
+                self.set_brush(size)
+            self.set_color(color.color)
+            for j, stroke in enumerate(strokes, first):
+                if cancel is not None and cancel.is_set():
+                    return Checkpoint(i, j)
+                points = stroke.tolist()
+                if debug:
+                    log.debug("stroke from %s through %d more points", points[0], len(points) - 1)
+                self.draw_stroke(points)
+                self.mouse.flush()
+        return None
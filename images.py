@@ -0,0 +1,64 @@
+import logging
+import threading
+from typing import Callable, Optional, Union
+
+from PIL import Image
+
+import planner
+
+log = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (200, 200)
+# the smallest decode that still has a pixel for every pixel of the preview and of the drawing grid
+WORKING_SIZE = (max(PREVIEW_SIZE[0], planner.DRAW_SIZE[0]), max(PREVIEW_SIZE[1], planner.DRAW_SIZE[1]))
+
+
+def decode(source: Union[str, Image.Image], size=WORKING_SIZE) -> Image.Image:
+    """Decodes an image file (or loads an opened image) at about `size`, as RGB.
+
+    JPEGs are decoded at a fraction of their size right away (draft mode), like thumbnail() does, and
+    never smaller than `size`. Nothing else is scaled here: any filtering would blend the pixels along
+    edges into colors of their own, which planner.quantize then draws as well. It picks its pixels from
+    the decode with NEAREST.
+    """
+    img = Image.open(source) if isinstance(source, str) else source
+    img.draft("RGB", size)
+    return img.convert("RGB")
+
+
+class DecodedImage:
+    """An image source, a file path or an opened image, decoded once in the background.
+
+    The preview and the drawing input are both made from the same decode. `done(decoded)` is called
+    from the decoding thread when it has finished, also if it has failed.
+    """
+
+    def __init__(self, source: Union[str, Image.Image], done: Optional[Callable[["DecodedImage"], None]] = None):
+        self.source = source
+        self.path = source if isinstance(source, str) else None
+        self.preview: Optional[Image.Image] = None
+        self._img = None
+        self._error = None
+        self._done = done
+        self._ready = threading.Event()
+        threading.Thread(target=self._decode, daemon=True).start()
+
+    def _decode(self):
+        try:
+            self._img = decode(self.source)
+            preview = self._img.copy()
+            preview.thumbnail(PREVIEW_SIZE, Image.NEAREST)
+            self.preview = preview
+        except Exception as e:
+            log.warning("could not decode %s: %s", self.path or "the image", e)
+            self._error = e
+        self._ready.set()
+        if self._done is not None:
+            self._done(self)
+
+    def image(self) -> Image.Image:
+        """The decoded image, waiting for the decode if needed; raises what made the decode fail."""
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self._img
@@ -1,34 +1,60 @@
+import time
+
+STARTED = time.perf_counter()  # the startup is timed from here, before anything heavy is imported
+
 import functools
+import logging
+import os
 import sys
-import time
-import traceback
-import urllib
-import urllib.request
-from io import BytesIO
+import threading
 
 from PIL import Image
 from PIL.ImageQt import ImageQt
-from PyQt5.QtCore import Qt, QThread
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QPixmap
 from PyQt5.QtWidgets import QApplication, QLabel, QWidget, QVBoxLayout, QSizePolicy, QGridLayout, QGroupBox, \
-    QHBoxLayout, QPushButton, QCommandLinkButton, QFileDialog, QInputDialog, QMessageBox, QCheckBox
-from pynput import mouse, keyboard
-from pynput.mouse import Controller, Button
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+    QHBoxLayout, QPushButton, QCommandLinkButton, QFileDialog, QInputDialog, QMessageBox, QCheckBox, \
+    QComboBox, QSpinBox
+
+import budget
+import calibration
+import downloads
+import drawing
+import ordering
+import pacing
+import planner
+import verify
+from backends import DevToolsBackend, screen_backend
+from browser import GameBrowser, ImageSearchBrowser
+from images import DecodedImage
+from metrics import Metrics
+from pipeline import StrokePipeline
+from plan_cache import PlanCache, plan_key
+from search_cache import SearchCache
 
 WEBDRIVER_PATH = "./chromedriver"
+RESUME_KEY = "f8"  # name of the pynput key
+RESUME_KEY_NAME = "F8"
+STARTUP_TARGET = 1.0  # seconds until the window shows, the time it really took is logged
+
+log = logging.getLogger("autoskribbler")
 
 class MainWindow(QWidget):
+    resume_requested = pyqtSignal()  # emitted by the hotkey listener, handled in the GUI thread
+    preview_ready = pyqtSignal(object)  # emitted with a DecodedImage by its decoding thread
+
     def __init__(self, *args, **kwargs):
         QWidget.__init__(self, None, Qt.WindowStaysOnTopHint, *args, **kwargs)
 
         self.ImgOriginSelector = ImgOriginSelector(self)
         self.select_coords_thread = SelectCoordsThread(self)
         self.ImageDrawingThread = ImageDrawingThread(self)
+        self.ImageDrawingThread.finished.connect(self.img_drawing_done)
+        self.resume_requested.connect(self.resume_drawing)
+        self.preview_ready.connect(self.show_img_preview)
 
         self.layout = QGridLayout()
-        self.resize(350, 440)
+        self.resize(350, 660)
         self.setWindowTitle("AutoSkribbler")
         self.headline = QLabel("AutoSkribbler", self)
         self.headline.setFont(QFont("Sans Serif", 20, 600))
@@ -71,8 +97,56 @@ class MainWindow(QWidget):
 
 
         self.useImgWorkaroundCheckbox = QCheckBox("Use google images workaround (slow)")
+        # the browser for it gets started as soon as it may be needed and is reused for every search
+        self.image_search = ImageSearchBrowser(WEBDRIVER_PATH)
+        self.useImgWorkaroundCheckbox.stateChanged.connect(
+            lambda state: self.image_search.start() if state else None)
         self.layout.addWidget(self.useImgWorkaroundCheckbox, 6, 0)
 
+        self.useFillCheckbox = QCheckBox("Use fill bucket for large areas")
+        self.layout.addWidget(self.useFillCheckbox, 7, 0)
+
+        self.useBrushSizesCheckbox = QCheckBox("Use bigger brushes for large areas")
+        self.layout.addWidget(self.useBrushSizesCheckbox, 8, 0)
+
+        self.progressiveCheckbox = QCheckBox("Draw a rough version first")
+        self.layout.addWidget(self.progressiveCheckbox, 9, 0)
+
+        # with the fill bucket option, large areas get a few strokes of color as well
+        self.contoursCheckbox = QCheckBox("Only draw outlines, like a sketch")
+        self.layout.addWidget(self.contoursCheckbox, 10, 0)
+
+        self.verifyCheckbox = QCheckBox("Check the drawing and fix mistakes")
+        self.layout.addWidget(self.verifyCheckbox, 11, 0)
+
+        # draws straight into the page, so the coordinates are read from there and the mouse stays free
+        self.gameBrowserCheckbox = QCheckBox("Play in a Chrome window of its own")
+        self.game_browser = GameBrowser(WEBDRIVER_PATH)
+        self.gameBrowserCheckbox.stateChanged.connect(
+            lambda state: self.game_browser.start() if state else None)
+        self.layout.addWidget(self.gameBrowserCheckbox, 12, 0)
+
+        self.quantizerBox = QHBoxLayout()
+        self.ditherComboBox = QComboBox()
+        self.ditherComboBox.addItems(["Floyd-Steinberg dithering", "Ordered dithering", "No dithering"])
+        self.useLabCheckbox = QCheckBox("Perceptual colors")
+        self.quantizerBox.addWidget(self.ditherComboBox)
+        self.quantizerBox.addWidget(self.useLabCheckbox)
+        self.layout.addLayout(self.quantizerBox, 13, 0)
+
+        self.pacingBox = QHBoxLayout()
+        self.pacingBox.addWidget(QLabel("Pacing:"))
+        self.pacingComboBox = QComboBox()
+        self.pacingProfiles = pacing.load_profiles()
+        self.pacingComboBox.addItems(list(self.pacingProfiles))
+        self.pacingBox.addWidget(self.pacingComboBox)
+        self.budgetSpinBox = QSpinBox()
+        self.budgetSpinBox.setRange(0, 300)
+        self.budgetSpinBox.setSuffix(" s")
+        self.budgetSpinBox.setSpecialValueText("No time limit")
+        self.pacingBox.addWidget(self.budgetSpinBox)
+        self.layout.addLayout(self.pacingBox, 14, 0)
+
         self.buttonbox = QHBoxLayout()
         self.btnSetCoords = QPushButton("Set Coords")
         self.btnSetCoords.clicked.connect(self.set_coords_btn_click)
@@ -83,43 +157,57 @@ class MainWindow(QWidget):
         self.buttonbox.addWidget(self.btnSetCoords)
         self.buttonbox.addWidget(self.btnSelImg)
         self.buttonbox.addWidget(self.btnStartDraw)
-        self.layout.addLayout(self.buttonbox, 7, 0)
+        self.layout.addLayout(self.buttonbox, 15, 0)
 
 
         self.setLayout(self.layout)
         self.show()
-
-        self.img_cache = []
+        # runs once the event loop has drawn the window
+        QTimer.singleShot(0, self.started)
 
         self.coords = {
             "canvasTopLeft": None,
             "colorsTopLeft": None,
+            "scale": 1.0,  # screen pixels per page pixel, only found by find_coords
         }
 
         self.actions = ["canvasTopLeft", "colorsTopLeft"]
         self.imgPath = None
         self.imgObj: Image = None
         self.preferLocalImg = True  # whether to prefer a local image over a grabbed image
+        self.decoded = None  # DecodedImage of the selected image
+
+    def started(self):
+        startup = time.perf_counter() - STARTED
+        if startup > STARTUP_TARGET:
+            log.warning("the window took %.2f s to show, more than the %.1f s it should", startup, STARTUP_TARGET)
+        else:
+            log.info("the window took %.2f s to show", startup)
+        start_key_listener()
 
     def sel_img_btn_click(self):
         self.ImgOriginSelector.show()
 
+    def selected_image(self):
+        """The image to draw, decoded once per selection in the background (see images.py)."""
+        if self.imgPath and (self.preferLocalImg or not self.imgObj):
+            source = self.imgPath
+        else:
+            source = self.imgObj
+        if not source:
+            return None
+        if self.decoded is None or self.decoded.source is not source:
+            self.decoded = DecodedImage(source, self.preview_ready.emit)
+        return self.decoded
+
     def reload_img_preview(self):
-        img: Image = None
-        if self.imgPath and self.imgObj:
-            if self.preferLocalImg:
-                img: Image = Image.open(self.imgPath)
-            else:
-                img: Image = self.imgObj
-        elif self.imgPath:
-            img: Image = Image.open(self.imgPath)
-        elif self.imgObj:
-            img: Image = self.imgObj
-        img = img.convert("RGB")
-        img.thumbnail((200, 200), Image.NEAREST)
-        qimg = ImageQt(img)
-        pixmap = QPixmap.fromImage(qimg)
-        self.imgPreview.setPixmap(pixmap)
+        """Shows the preview as soon as the image is decoded."""
+        self.selected_image()
+
+    def show_img_preview(self, decoded):
+        if decoded is not self.decoded or decoded.preview is None:
+            return  # another image was selected meanwhile, or this one could not be decoded
+        self.imgPreview.setPixmap(QPixmap.fromImage(ImageQt(decoded.preview)))
 
     def clear_img_preview(self):
         self.imgPreview.clear()
@@ -133,6 +221,18 @@ class MainWindow(QWidget):
         self.currentActionLabel.setText("Selecting Coords…")
         self.currentActionSubLabel.setText("Click at the top left of the canvas first, \nthen at the top left of the color palette.")
 
+    def find_coords(self) -> bool:
+        """Calibrates from a screenshot instead of clicks, see calibration.py."""
+        found = calibration.auto_calibrate()
+        if found is None:
+            return False
+        self.coords["canvasTopLeft"] = found.canvas_top_left
+        self.coords["colorsTopLeft"] = found.colors_top_left
+        self.coords["scale"] = found.scale
+        self.coordCanvas.setText("Canvas (top left): " + str(found.canvas_top_left))
+        self.coordColors.setText("Colors (top left): " + str(found.colors_top_left))
+        return True
+
     def set_coords_finished(self):
         self.currentActionLabel.setText(" ")
         self.currentActionSubLabel.setText(" ")
@@ -141,40 +241,42 @@ class MainWindow(QWidget):
         self.btnStartDraw.setEnabled(True)
 
     def start_draw_btn_click(self):
-        img = None
-        if self.imgPath and self.imgObj:
-            if self.preferLocalImg:
-                img = Image.open(self.imgPath)
-            else:
-                img = self.imgObj
-        elif self.imgPath:
-            img = Image.open(self.imgPath)
-        elif self.imgObj:
-            img = self.imgObj
-
-        if not self.coords['canvasTopLeft'] or not self.coords['colorsTopLeft']:
-            QMessageBox.warning(self, "Error", "At least one coord is invalid.\nPlease set the coordinates first.")
+        img = self.selected_image()
+
+        if not self.gameBrowserCheckbox.isChecked() and \
+                (not self.coords['canvasTopLeft'] or not self.coords['colorsTopLeft']) and not self.find_coords():
+            QMessageBox.warning(self, "Error", "Could not find the canvas (it has to be empty) and the colors.\n"
+                                               "Please set the coordinates first.")
             return
         if not img:
             QMessageBox.warning(self, "Error", "No image selected.\nPlease select an image first.")
             return
 
+        self.ImageDrawingThread.set_img(img)
+        self.start_drawing_thread()
+
+    def resume_drawing(self):
+        if not self.ImageDrawingThread.isRunning() and self.ImageDrawingThread.checkpoint is not None:
+            self.start_drawing_thread()
+
+    def start_drawing_thread(self):
         self.btnStartDraw.setEnabled(False)
         self.btnSelImg.setEnabled(False)
         self.btnSetCoords.setEnabled(False)
         self.currentActionLabel.setText("Currently drawing…")
-        self.currentActionSubLabel.setText("Press ESC to kill")
-        self.ImageDrawingThread.set_img(img)
-        self.ImageDrawingThread.finished.connect(self.img_drawing_done)
+        self.currentActionSubLabel.setText("Press ESC to pause")
         self.ImageDrawingThread.start()
 
     def img_drawing_done(self):
-        print("done with drawing!")
         self.btnStartDraw.setEnabled(True)
         self.btnSelImg.setEnabled(True)
         self.btnSetCoords.setEnabled(True)
-        self.currentActionLabel.setText(" ")
-        self.currentActionSubLabel.setText(" ")
+        if self.ImageDrawingThread.checkpoint is not None:
+            self.currentActionLabel.setText("Paused")
+        else:
+            log.info("done with drawing!")
+            self.currentActionLabel.setText("Done")
+        self.currentActionSubLabel.setText(self.ImageDrawingThread.status)
 
 
 class ImgOriginSelector(QWidget):
@@ -203,8 +305,12 @@ class ImgOriginSelector(QWidget):
         self.layout.addLayout(self.buttonlayout, 1, 0)
         self.setLayout(self.layout)
 
-        self.GrabImagesThread = GrabImagesThread(self.main_window)
+        self.GrabImagesThread = None  # of the latest grab
+        self.grabs = set()  # threads still running, kept until they are finished
+        self.grab_id = 0
         self.GrabSelector = GrabSelector(self.main_window)
+        # picking an image ends the downloads
+        self.GrabSelector.closing.connect(self.stop_grab)
 
     def select_local_img(self):
         filediag = QFileDialog()
@@ -213,38 +319,57 @@ class ImgOriginSelector(QWidget):
         path = filediag.getOpenFileName(self, "Open local image", filter="Image Files (*.jpg *.jpeg *.png *.gif)")
         path = str(path[0])
         self.main_window.imgPath = path
-        self.main_window.reload_img_preview()
         self.main_window.preferLocalImg = True
-        print(self.main_window.imgPath)
+        self.main_window.reload_img_preview()
+        log.info("selected %s", self.main_window.imgPath)
         self.close()
 
 
     def grab_img(self, count):
         text, ok = QInputDialog.getText(self, 'Enter search term', 'Search term:')
         if ok:
-            self.GrabImagesThread.set_query(text)
-            self.GrabImagesThread.set_count(count)
-            self.GrabImagesThread.finished.connect(self.img_download_done)
-            self.GrabImagesThread.start()
+            # a stopped grab may still be searching; it gets a thread of its own to finish in, and
+            # whatever it still sends is told apart by its id
+            self.stop_grab()
+            self.grab_id += 1
+            thread = GrabImagesThread(self.main_window, text, count, self.grab_id)
+            thread.status.connect(self.show_grab_status)
+            thread.thumbnail_ready.connect(self.GrabSelector.add_image)
+            thread.finished.connect(functools.partial(self.img_download_done, thread))
+            self.GrabImagesThread = thread
+            self.grabs.add(thread)
             self.main_window.btnSetCoords.setEnabled(False)
             self.main_window.btnSelImg.setEnabled(False)
             self.main_window.btnStartDraw.setEnabled(False)
             self.main_window.currentActionLabel.setText("Grabbing images…")
+            self.main_window.clear_img_preview()
+            self.GrabSelector.open(self.grab_id)
+            thread.start()
             self.close()
 
+    def stop_grab(self):
+        if self.GrabImagesThread is not None:
+            self.GrabImagesThread.stop()
+
+    def show_grab_status(self, grab, text):
+        if grab == self.grab_id:
+            self.main_window.currentActionSubLabel.setText(text)
+
     def grab_img_9(self):
         self.grab_img(9)
 
     def grab_img_5(self):
         self.grab_img(5)
 
-    def img_download_done(self):
+    def img_download_done(self, thread):
+        self.grabs.discard(thread)
+        if thread is not self.GrabImagesThread:
+            return
         self.main_window.btnSetCoords.setEnabled(True)
         self.main_window.btnStartDraw.setEnabled(True)
         self.main_window.currentActionLabel.setText(" ")
         self.main_window.currentActionSubLabel.setText(" ")
-        self.main_window.clear_img_preview()
-        self.GrabSelector.start(self.main_window.img_cache)
+        self.GrabSelector.downloads_done()
 
 
 
@@ -255,6 +380,9 @@ class SelectCoordsThread(QThread):
         self.currentPos = (0, 0)
 
     def run(self) -> None:
+        from pynput import mouse
+        # clicked coordinates come without a scale, the page is taken to be shown at its own size
+        self.main_window_instance.coords["scale"] = 1.0
         for action in self.main_window_instance.actions:
             with mouse.Listener(
                     on_click=self.on_click) as listener:
@@ -274,46 +402,79 @@ class SelectCoordsThread(QThread):
 
 
 class GrabImagesThread(QThread):
-    def __init__(self, main_window_instance, *args, **kwargs):
+    """Finds images for the query and emits their thumbnails one by one, cached ones first.
+
+    Everything the GUI gets goes through the signals, tagged with the id of the grab, so no widget is
+    touched from this thread. Once stopped, it emits nothing anymore and ends as soon as it can.
+    """
+
+    status = pyqtSignal(int, str)
+    thumbnail_ready = pyqtSignal(int, object)  # a PIL image
+
+    def __init__(self, main_window_instance, query, count, grab_id, *args, **kwargs):
         QThread.__init__(self, *args, **kwargs)
         self.main_window_instance = main_window_instance
-        self.query = None
-        self.count = 0
-
-    def set_count(self, count):
+        self.query = query
         self.count = count
+        self.grab_id = grab_id
+        self.search_cache = SearchCache()
+        self.stopped = threading.Event()
 
-    def set_query(self, query):
-        self.query = query
+    def stop(self):
+        """Drops the downloads that are still running or queued."""
+        self.stopped.set()
+
+    def emit_status(self, text):
+        if not self.stopped.is_set():
+            self.status.emit(self.grab_id, text)
+
+    def emit_thumbnail(self, img):
+        if not self.stopped.is_set():
+            self.thumbnail_ready.emit(self.grab_id, img)
 
     def run(self) -> None:
-        if self.main_window_instance.useImgWorkaroundCheckbox.isChecked():
-            url_list = Utils.fetch_image_urls(self.main_window_instance, self.query, self.count, 0.2)
+        url_list = self.search_cache.get_urls(self.query)
+        if url_list is None or len(url_list) < self.count:
+            if self.main_window_instance.useImgWorkaroundCheckbox.isChecked():
+                url_list = self.main_window_instance.image_search.fetch_image_urls(
+                    self.query, self.count, lambda i, count: self.emit_status("Grabbing " + str(i) + "/" + str(count)))
+            else:
+                from google_images_download import google_images_download
+                response = google_images_download.googleimagesdownload()
+                URLs = response.download({"keywords": self.query, "limit": self.count, "no_download": True})
+                for kw in URLs[0]:
+                    url_list = URLs[0][kw]
+            url_list = list(url_list or [])
+            if url_list:
+                self.search_cache.put_urls(self.query, url_list)
         else:
-            from google_images_download import google_images_download
-            response = google_images_download.googleimagesdownload()
-            URLs = response.download({"keywords": self.query, "limit": self.count, "no_download": True})
-            for kw in URLs[0]:
-                url_list = URLs[0][kw]
-        lis = []
-        i = 0
+            log.info("using cached search results")
+        url_list = url_list[:self.count]
+        missing = []
         for url in url_list:
-            self.main_window_instance.currentActionSubLabel.setText("Downloading " + str(i + 1) + "/" + str(self.count))
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            try:
-                res = urllib.request.urlopen(req)
-                raw_data = res.read()
-                img = Image.open(BytesIO(raw_data))
-                img.thumbnail((200, 200), Image.NEAREST)
-                img = img.convert("RGB")
-                lis.append(img)
-            except Exception:
-                print("error")
-            i += 1
-        self.main_window_instance.img_cache = lis
+            img = self.search_cache.get_thumbnail(url)
+            if img is None:
+                missing.append(url)
+            else:
+                self.emit_thumbnail(img)
+        if self.stopped.is_set():
+            return
+        self.emit_status("Downloading " + str(len(missing)) + " images")
+        # the downloads watch the stop event themselves, so a stopped grab doesn't wait for the next one to finish
+        for i, (url, img) in enumerate(downloads.fetch_thumbnails(missing, stop=self.stopped), 1):
+            if self.stopped.is_set():
+                break
+            self.emit_status("Downloaded " + str(i) + "/" + str(len(missing)))
+            if img is not None:
+                self.search_cache.put_thumbnail(url, img)
+                self.emit_thumbnail(img)
 
 
 class GrabSelector(QWidget):
+    """The grid of grabbed thumbnails. It opens before the downloads and any image can be picked once it is shown."""
+
+    closing = pyqtSignal()
+
     def __init__(self, main_window_instance, *args, **kwargs):
         QWidget.__init__(self, None, Qt.WindowStaysOnTopHint, *args, **kwargs)
         self.main_window = main_window_instance
@@ -336,15 +497,17 @@ class GrabSelector(QWidget):
 
         self.qimages = []
         self.pilimages = []
+        self.opened = None  # perf_counter() of open(), for the time until the first image
+        self.grab_id = None  # the grab whose images are shown
 
     def closeEvent(self, event) -> None:
         self.prepare_close()
         super(GrabSelector, self).closeEvent(event)
 
     def prepare_close(self):
+        self.closing.emit()
         self.qimages = []
         self.pilimages = []
-        self.main_window.img_cache = []
         for i in reversed(range(self.imggrid.count())):
             self.imggrid.itemAt(i).widget().setParent(None)
         self.main_window.btnSelImg.setEnabled(True)
@@ -354,32 +517,35 @@ class GrabSelector(QWidget):
         self.prepare_close()
         self.close()
 
-    def start(self, img_list):
-        row = 0
-        col = 0
-        self.pilimages = img_list
-        self.qimages = [ImageQt(im) for im in self.pilimages]  # workaround for weird image glitching bug in PyQt
-
-        i = 0
-        for qimg in self.qimages:
-            label = QLabel()
-            label.setPixmap(QPixmap.fromImage(qimg))
-            label.mousePressEvent = functools.partial(self.on_img_select, pil_img_obj=self.pilimages[i])
-            self.imggrid.addWidget(label, row, col)
-
-            if col < 2:
-                col += 1
-            else:
-                row += 1
-                col = 0
-            i += 1
+    def open(self, grab_id):
+        self.headline.setText("Loading images…")
+        self.opened = time.perf_counter()
+        self.grab_id = grab_id
         self.show()
 
+    def add_image(self, grab_id, pil_img_obj: Image):
+        if grab_id != self.grab_id or not self.isVisible():
+            return  # of an earlier grab, or arrived after the picker was closed
+        if not self.pilimages:
+            log.info("first image after %.2f s", time.perf_counter() - self.opened)
+            self.headline.setText("Select image to draw")
+        row, col = divmod(len(self.pilimages), 3)
+        self.pilimages.append(pil_img_obj)
+        self.qimages.append(ImageQt(pil_img_obj))  # workaround for weird image glitching bug in PyQt
+        label = QLabel()
+        label.setPixmap(QPixmap.fromImage(self.qimages[-1]))
+        label.mousePressEvent = functools.partial(self.on_img_select, pil_img_obj=pil_img_obj)
+        self.imggrid.addWidget(label, row, col)
+
+    def downloads_done(self):
+        if self.isVisible() and not self.pilimages:
+            self.headline.setText("No images found")
+
 
     def on_img_select(self, event, pil_img_obj: Image):
         # print(type(pil_img_obj))
         # pil_img_obj.show()
-        print("Selected image!")
+        log.info("Selected image!")
         self.main_window.imgObj = pil_img_obj
         self.main_window.preferLocalImg = False
         self.main_window.reload_img_preview()
@@ -391,308 +557,196 @@ class ImageDrawingThread(QThread):
     def __init__(self, main_window_instance, *args, **kwargs):
         QThread.__init__(self, *args, **kwargs)
         self.main_window_instance = main_window_instance
+        self.source = None  # the DecodedImage to draw
         self.img = None
-        available_colors = [255, 255, 255, 193, 193, 193, 239, 19, 11, 255, 115, 0, 255, 228, 0, 0, 204, 0, 0, 178, 255, 35, 31, 211, 163, 0, 186, 211, 124, 170, 160, 82, 45, 0, 0, 0, 76, 76, 76, 116, 11, 7, 194, 56, 0, 232, 162, 0, 0, 85, 16, 0, 86, 158, 14, 8, 101, 85, 0, 105, 167, 85, 116, 99, 48, 13]
-
-        # adding placeholders because Pillow pallets need to have exactly 768 values
-        for _t in range(768-66):
-            available_colors.append(0)
-
-        # Creating an image that we apply the skribbl.io palette to (using that later as a template)
-        self.pal_image = Image.new("P", (16, 16))
-        self.pal_image.putpalette(available_colors)
-
-        self.prev_cursor = (0, 0)
-        self.mouse_controller = Controller()
-
-    def set_img(self, img_obj):
-        self.img = img_obj
-
-    def draw_pixel(self, x, y, step_size):
-        # mouse_controller.position = coords["canvasTopLeft"]
-        cX = self.main_window_instance.coords['canvasTopLeft'][0]
-        cY = self.main_window_instance.coords['canvasTopLeft'][1]
-        pX, pY = self.prev_cursor
-
-        if pX < x and pY < y:
-            self.mouse_controller.position = (cX + (x * step_size), cY + (y * step_size))
-        elif pX > x and pY > y:
-            self.mouse_controller.position = (cX + (x * step_size), cY + (y * step_size))
-        elif pX > x and pY < y:
-            self.mouse_controller.position = (cX + (x * step_size), cY + (y * step_size))
-        elif pX < x and pY > y:
-            self.mouse_controller.position = (cX + (x * step_size), cY + (y * step_size))
-        elif pX == x and pY > y:
-            self.mouse_controller.position = (cX + x, cY + (y * step_size))
-        elif pX == x and pY < y:
-            self.mouse_controller.position = (cX + x, cY + (y * step_size))
-        elif pX > x and pY == y:
-            self.mouse_controller.position = (cX + (x * step_size), cY + y)
-        elif pX < x and pY == y:
-            self.mouse_controller.position = (cX + (x * step_size), cY + y)
-
-        self.prev_cursor = self.mouse_controller.position
-        self.mouse_controller.click(Button.left)
-
-    def move_one_step_to_right(self, step_size):
-        self.mouse_controller.move(step_size, 0)
-
-    def set_brush(self):
-        self.mouse_controller.position = self.main_window_instance.coords['colorsTopLeft']
-        print("setting brush")
-        self.mouse_controller.move(492, 24)
-        self.mouse_controller.press(Button.left)
-        self.mouse_controller.release(Button.left)
-
-    def set_color(self, r, g, b):
-        """yes I do know that this is dirty af but who cares :p"""
-        self.mouse_controller.position = self.main_window_instance.coords['colorsTopLeft']
-        print("setting color to " + str(r) + ", " + str(g) + ", " + str(b))
-        r = int(r)
-        g = int(g)
-        b = int(b)
-        if r == 255 and g == 255 and b == 255:
-            self.mouse_controller.move(12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 193 and g == 193 and b == 193:
-            self.mouse_controller.move(24 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 239 and g == 19 and b == 11:
-            self.mouse_controller.move(24 * 2 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 255 and g == 115 and b == 0:
-            self.mouse_controller.move(24 * 3 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 255 and g == 228 and b == 0:
-            self.mouse_controller.move(24 * 4 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 0 and g == 204 and b == 0:
-            self.mouse_controller.move(24 * 5 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 0 and g == 178 and b == 255:
-            self.mouse_controller.move(24 * 6 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 35 and g == 31 and b == 211:
-            self.mouse_controller.move(24 * 7 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 163 and g == 0 and b == 186:
-            self.mouse_controller.move(24 * 8 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 211 and g == 124 and b == 170:
-            self.mouse_controller.move(24 * 9 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 160 and g == 82 and b == 45:
-            self.mouse_controller.move(24 * 10 + 12, 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 0 and g == 0 and b == 0:
-            self.mouse_controller.move(12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 76 and g == 76 and b == 76:
-            self.mouse_controller.move(24 * 1 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 116 and g == 11 and b == 7:
-            self.mouse_controller.move(24 * 2 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 194 and g == 56 and b == 0:
-            self.mouse_controller.move(24 * 3 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 232 and g == 162 and b == 0:
-            self.mouse_controller.move(24 * 4 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 0 and g == 85 and b == 16:
-            self.mouse_controller.move(24 * 5 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 0 and g == 86 and b == 158:
-            self.mouse_controller.move(24 * 6 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 14 and g == 8 and b == 101:
-            self.mouse_controller.move(24 * 7 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 85 and g == 0 and b == 105:
-            self.mouse_controller.move(24 * 8 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 167 and g == 85 and b == 116:
-            self.mouse_controller.move(24 * 9 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        elif r == 99 and g == 48 and b == 13:
-            self.mouse_controller.move(24 * 10 + 12, 24 + 12)
-            self.mouse_controller.press(Button.left)
-            self.mouse_controller.release(Button.left)
-        else:
-            app.warningBox("Error", "Couldn't find color R" + str(r) + " G" + str(g) + " B" + str(b))
+        self.img_path = None
+        self.mouse_controller = None  # connected on the first drawing, not to slow down the startup
+        self.capture = verify.ScreenCapture()
+        self.plan_cache = PlanCache()
+        self.pause = threading.Event()  # set by ESC
+        self.metrics = Metrics()
+        self.status = " "  # summary of the last run for the main window
+        # the drawing in progress: a plan or a StrokePipeline, the quantized image it draws, the CostModel,
+        # the cell size, the predicted seconds (None until the plan is complete) and where it was paused
+        self.plan = None
+        self.target = None
+        self.model = None
+        self.step_size = planner.CELL_SIZE
+        self.predicted = None
+        self.checkpoint = None
+
+    def set_img(self, source: DecodedImage):
+        """Plans of image files are cached by the file's bytes, of other images by their pixels.
+
+        A paused drawing of the previous image cannot be resumed anymore.
+        """
+        self.source = source
+        self.img = None
+        self.img_path = source.path
+        self.discard()
+
+    def discard(self):
+        if isinstance(self.plan, StrokePipeline):
+            self.plan.cancel.set()
+        self.plan = None
+        self.checkpoint = None
+
+    def image_content(self) -> bytes:
+        if self.img_path:
+            with open(self.img_path, "rb") as file:
+                return file.read()
+        img = self.source.source  # the image as it was selected, which needs no decoding
+        return repr((img.mode, img.size)).encode() + img.tobytes()
 
     def run(self) -> None:
-        pixel_colors = {}
-
-        def has_neighbor(pixel1, pixel_map) -> bool:
-            # print(1)
-            # if pixel1 in pixel_map:
-            #     index_in_pixel_map = pixel_map.index(pixel1)
-            #     print(2)
-            #     pixelX, pixelY = pixel1
-            #     if len(pixel_map) - 1 == index_in_pixel_map:  # check if there even is a next pixel
-            #         print(3)
-            #         nextPixelX, nextPixelY = pixel_map[index_in_pixel_map + 1]  # nextPixel refers to the next pixel in the pixel map, not next to it in the pixel *grid*
-            #         if pixelY == nextPixelY and pixelX + 1 == nextPixelX:  # check if the current pixel and the next pixel are in the same line and if the current pixel plus one is the next pixel, i.e. it the next pixel is directly next to the current pixel
-            #             return True
-            #         else:
-            #             return False
-            #     else:
-            #         return False
-            # else:
-            #     return False
-            pixelX, pixelY = pixel1
-            pixelNext = (pixelX + 1, pixelY)
-            if pixelNext in pixel_map:
-                return True
-            else:
-                return False
-
+        """Plans and draws the image, or resumes the paused drawing."""
+        self.pause.clear()
         try:
-            self.img.thumbnail((133, 100), Image.NEAREST)
-            self.img = self.img.convert("RGB").quantize(palette=self.pal_image)
-            width, height = self.img.size
-            self.img = self.img.convert("RGB")
-            for y in range(height):
-                for x in range(width):
-                    r, g, b = self.img.getpixel((x, y))
-
-                    if r == 255 and g == 255 and b == 255:
-                        continue  # skip white because canvas is… white
-
-                    key = ' '.join([str(r), str(g), str(b)])
-                    if key not in pixel_colors:
-                        pixel_colors[key] = []
-                    pixel_colors[key].append((x, y))
-
-            print(pixel_colors)
-            self.set_brush()
-            for kay in pixel_colors:
-                print(kay)
-
-                r, g, b = kay.split(' ')
-                print(r, g, b)
-                self.set_color(r, g, b)
-                time.sleep(1)
-                i = 0
-                skip_amount = 0
-                for pixel in pixel_colors[kay]:
-                    if skip_amount > 0:
-                        skip_amount -= 1
-                        continue
-                    x, y = pixel
-                    if has_neighbor(pixel, pixel_colors[kay]):
-                        print("pixel ", x, y, " has a neighbor")
-                        canvasTopX, canvasTopY = self.main_window_instance.coords['canvasTopLeft']
-                        self.mouse_controller.position = (canvasTopX + (x * 6), canvasTopY + (y * 6))
-                        self.mouse_controller.press(Button.left)  # press the mouse button
-                        virtual_pixel = pixel  # the virtual_pixel is the pixel that will iterate through the current line
-                        currently_skipped = 0
-                        while has_neighbor(virtual_pixel, pixel_colors[kay]):
-                            print("iterating through the pixel", virtual_pixel[0], y, "'s neigbors…")
-                            self.move_one_step_to_right(6)  # move mouse six pixels to the right
-                            virtual_pixel = (virtual_pixel[0] + 1, y)  # move "virtual pixel" one to the right
-                            currently_skipped += 1
-                        self.mouse_controller.release(Button.left)  # release the mouse button
-                        skip_amount = currently_skipped
-                    else:
-                        print("pixel ", x, y, " has no neighbor")
-                        self.draw_pixel(x, y, 6)
-                    time.sleep(0.0005)
-                    i += 1
-
-
+            if self.checkpoint is not None:
+                log.info("resuming at pass %d, stroke %d", *self.checkpoint)
+            else:
+                self.metrics = Metrics()
+                self.prepare()
+            self.draw()
         except Exception as e:
-            print(traceback.format_exc())
+            log.exception("drawing failed")
+            self.discard()
             # app.warningBox("An error occurred", "An error occurred:\n" + str(e))
 
-
-class Utils:
-    @staticmethod
-    def fetch_image_urls(main_window_instance, query: str, max_links_to_fetch: int, sleep_between_interactions = 1):
-        def scroll_to_end(wd):
-            wd.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(sleep_between_interactions)
-
-            # build the google query
-
-        search_url = "https://www.google.com/search?safe=off&site=&tbm=isch&source=hp&q={q}&oq={q}&gs_l=img"
-
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--window-size=1920x1080")
-        wd = webdriver.Chrome(executable_path=WEBDRIVER_PATH, options=chrome_options)
-        wd.get(search_url.format(q=query))
-
-        image_urls = set()
-        image_count = 0
-        results_start = 0
-        while image_count < max_links_to_fetch:
-            scroll_to_end(wd)
-            # get all image thumbnail results
-            thumbnail_results = wd.find_elements_by_css_selector("img.Q4LuWd")
-            number_results = len(thumbnail_results)
-            print(f"Found: {number_results} search results. Extracting links from {results_start}:{number_results}")
-            for img in thumbnail_results[results_start:number_results]:
-                main_window_instance.currentActionSubLabel.setText("Grabbing " + str(image_count + 1) + "/" + str(max_links_to_fetch))
-                # try to click every thumbnail such that we can get the real image behind it
-                try:
-                    img.click()
-                    time.sleep(sleep_between_interactions)
-                except Exception:
-                    continue
-
-                # extract image urls
-                actual_images = wd.find_elements_by_css_selector('img.n3VNCb')
-                for actual_image in actual_images:
-                    if actual_image.get_attribute('src') and 'http' in actual_image.get_attribute('src'):
-                        image_urls.add(actual_image.get_attribute('src'))
-
-                image_count = len(image_urls)
-
-                if len(image_urls) >= max_links_to_fetch:
-                    print(f"Found: {len(image_urls)} image links, done!")
-                    return image_urls
-
-            # move the result startpoint further down
-            results_start = len(thumbnail_results)
-        return None
-
-
-def handle_esc(key):
-    if key == keyboard.Key.esc:
-        print("stopped through ESC")
-        app.quit()
-        sys.exit(1)
-
-
-key_listener = keyboard.Listener(
-    on_release=handle_esc)
-key_listener.start()
-
-
+    def prepare(self):
+        fill = self.main_window_instance.useFillCheckbox.isChecked()
+        sizes = planner.BRUSH_SIZES if self.main_window_instance.useBrushSizesCheckbox.isChecked() else None
+        dither = ["floyd-steinberg", "ordered", "none"][self.main_window_instance.ditherComboBox.currentIndex()]
+        metric = "lab" if self.main_window_instance.useLabCheckbox.isChecked() else "rgb"
+        progressive = self.main_window_instance.progressiveCheckbox.isChecked()
+        contours = self.main_window_instance.contoursCheckbox.isChecked()
+        gaps = self.main_window_instance.pacingProfiles[self.main_window_instance.pacingComboBox.currentText()]
+        self.model = budget.CostModel(latency=budget.fit_latency(), gaps=gaps)
+        self.step_size = planner.CELL_SIZE
+        time_budget = self.main_window_instance.budgetSpinBox.value()
+        # the quantized image is only kept to check the drawing; sketches are not checked, as they leave
+        # out most pixels on purpose
+        verifying = self.main_window_instance.verifyCheckbox.isChecked() and not contours
+        self.target = None
+        if time_budget:
+            with self.metrics.phase("decode"):
+                self.img = self.source.image()  # decoded in the background since the image was selected
+            # picks its own resolution and brushes, the other planner options don't apply
+            with self.metrics.phase("plan"):
+                self.plan, self.step_size, self.predicted = budget.plan_within_budget(
+                    self.img, time_budget, self.model, dither=dither, metric=metric)
+            log.info("drawing with %d px cells", self.step_size)
+            if verifying:
+                size = (round(budget.CANVAS_SIZE[0] / self.step_size),
+                        round(budget.CANVAS_SIZE[1] / self.step_size))
+                self.target = planner.quantize(self.img, size, dither=dither, metric=metric)
+            return
+        # looked up before waiting for the decode, which a cached plan doesn't need
+        # the brush size planner, which also plans the last progressive pass, weighs extra passes by the
+        # pacing, so plans for other pacings differ; the fitted latency only moves the weight a little and would miss the cache after every drawing
+        key = plan_key(self.image_content(), fill=fill, sizes=sizes, dither=dither, metric=metric,
+                       progressive=progressive, contours=contours,
+                       pacing=sorted(gaps.items()) if sizes or progressive else None)
+        self.plan = self.plan_cache.get(key)
+        if self.plan is not None:
+            log.info("using cached plan")
+            self.predicted = self.model.predict(self.plan)
+            if verifying:
+                with self.metrics.phase("decode"):
+                    self.img = self.source.image()
+                self.target = planner.quantize(self.img, dither=dither, metric=metric)
+            return
+        with self.metrics.phase("decode"):
+            self.img = self.source.image()
+
+        def produce():
+            with self.metrics.phase("quantize"):
+                idx = planner.quantize(self.img, dither=dither, metric=metric)
+            if verifying:
+                self.target = idx
+            colors = planner.iter_strokes(idx, fill, sizes, progressive, contours, self.model.switch_events())
+            plan = []
+            travel_before = travel_after = 0
+            while True:
+                with self.metrics.phase("plan"):
+                    color = next(colors, None)
+                if color is None:
+                    break
+                with self.metrics.phase("order"):
+                    travel_before += ordering.strokes_travel(color)
+                    color = ordering.order_color_strokes(color)
+                    travel_after += ordering.strokes_travel(color)
+                plan.append(color)
+                yield color
+            log.info("cursor travel: %.0f -> %.0f cells", travel_before, travel_after)
+            self.plan_cache.put(key, plan)
+
+        # drawing starts with the first color while the others are still being planned
+        self.plan = StrokePipeline(produce)
+        self.predicted = None
+
+    def draw(self):
+        """Draws the plan from the checkpoint on; on ESC it keeps the place to resume from."""
+        if self.predicted is not None and self.checkpoint is None:
+            log.info("%d colors, %d strokes", len(self.plan), sum(len(color.strokes) for color in self.plan))
+            log.info("this will take about %.1f s", self.predicted)
+        if self.main_window_instance.gameBrowserCheckbox.isChecked():
+            backend = DevToolsBackend(self.main_window_instance.game_browser.driver)
+            capture = backend
+            layout = backend.layout()
+        else:
+            if self.mouse_controller is None:
+                self.mouse_controller = screen_backend()
+            backend = self.mouse_controller
+            capture = self.capture
+            coords = self.main_window_instance.coords
+            layout = calibration.Calibration(coords['canvasTopLeft'], coords['colorsTopLeft'], coords['scale'])
+        drawer = drawing.Drawer(backend, layout.canvas_top_left, layout.colors_top_left, self.step_size,
+                                pacing=self.model.gaps, metrics=self.metrics, scale=layout.scale)
+        with self.metrics.phase("draw"):
+            self.checkpoint = drawer.draw(self.plan, self.pause, self.checkpoint)
+        if self.checkpoint is not None:
+            log.info("paused at pass %d, stroke %d", *self.checkpoint)
+            self.status = "Press %s to resume" % RESUME_KEY_NAME
+            return
+        self.status = self.metrics.status()
+        log.info(self.status)
+        plan = self.plan.plan if isinstance(self.plan, StrokePipeline) else self.plan
+        predicted = self.model.predict(plan, self.step_size) if self.predicted is None else self.predicted
+        # the model predicts the drawing alone, so the time the drawer waited for the planner is left out
+        waited = self.plan.waited if isinstance(self.plan, StrokePipeline) else 0.0
+        budget.log_run(plan, self.model, predicted, self.metrics.phases["draw"] - waited)
+        residuals = []
+        if self.target is not None:
+            # the correction passes are timed on their own, so they don't distort the timing log
+            with self.metrics.phase("verify"):
+                residuals = verify.correct(drawer, capture, self.target, cancel=self.pause)
+            self.status += "\n%.1f %% still wrong after %d correction passes" % (100 * residuals[-1],
+                                                                                 len(residuals) - 1)
+        self.metrics.write(image=self.img_path, residuals=residuals)
+        self.plan = None
+
+
+def handle_key(key):
+    from pynput import keyboard
+    if key == keyboard.Key.esc and win.ImageDrawingThread.isRunning():
+        log.info("paused through ESC")
+        win.ImageDrawingThread.pause.set()
+    elif key == keyboard.Key[RESUME_KEY] and win.ImageDrawingThread.checkpoint is not None:
+        win.resume_requested.emit()
+
+
+def start_key_listener():
+    """pynput is only loaded once the window shows."""
+    from pynput import keyboard
+    keyboard.Listener(on_release=handle_key).start()
+
+
+logging.basicConfig(level=os.environ.get("AUTOSKRIBBLER_LOG", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 app = QApplication(sys.argv)
 win = MainWindow()
+app.aboutToQuit.connect(win.image_search.quit)
+app.aboutToQuit.connect(win.game_browser.quit)
 sys.exit(app.exec_())
 
@@ -0,0 +1,75 @@
+import bisect
+import contextlib
+import json
+import os
+import statistics
+import time
+from collections import Counter
+
+RUNS_LOG = os.path.join(os.path.expanduser("~"), ".cache", "autoskribbler", "runs.jsonl")
+
+# lower bounds of the buckets of the events per second histogram
+RATE_BUCKETS = (0, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Metrics:
+    """Timers for the phases of a run, counters for the input events and how many went out every second.
+
+    Recording is a dictionary update, cheap enough for every mouse event.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.phases = {}  # phase -> seconds spent in it
+        self.events = Counter()
+        self._per_second = Counter()  # whole seconds since the first event -> events in that second
+        self._first = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times a phase; a phase entered several times (e.g. once per color) adds up."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + self.clock() - start
+
+    def count(self, event):
+        now = self.clock()
+        if self._first is None:
+            self._first = now
+        self.events[event] += 1
+        self._per_second[int(now - self._first)] += 1
+
+    def rates(self):
+        """Events sent in every second since the first one."""
+        if not self._per_second:
+            return []
+        return [self._per_second[second] for second in range(max(self._per_second) + 1)]
+
+    def summary(self) -> dict:
+        rates = self.rates()
+        histogram = Counter(RATE_BUCKETS[bisect.bisect_right(RATE_BUCKETS, rate) - 1] for rate in rates)
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "events": dict(self.events),
+            "events_per_second": {
+                "median": statistics.median(rates) if rates else 0,
+                "max": max(rates, default=0),
+                "histogram": {str(bucket): histogram[bucket] for bucket in sorted(histogram)},
+            },
+        }
+
+    def status(self) -> str:
+        """One line for the status label of the main window."""
+        events = sum(self.events.values())
+        drawing = self.phases.get("draw", 0.0)
+        planning = sum(seconds for name, seconds in self.phases.items() if name != "draw")
+        return "%d events in %.1f s (%.0f/s), planning took %.1f s" % (
+            events, drawing, events / drawing if drawing else 0, planning)
+
+    def write(self, path=RUNS_LOG, **details):
+        """Appends the summary of the run, with any `details`, as one JSON line."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as file:
+            file.write(json.dumps(dict({"time": time.time()}, **details, **self.summary())) + "\n")
@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+
+from planner import ColorStrokes
+
+
+def _dist(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.hypot(a[..., 0] - b[..., 0], a[..., 1] - b[..., 1])
+
+
+def travel(starts: np.ndarray, ends: np.ndarray) -> float:
+    """Total distance the cursor jumps between the end of one stroke and the start of the next one."""
+    if len(starts) < 2:
+        return 0.0
+    return float(_dist(ends[:-1], starts[1:]).sum())
+
+
+def order_strokes(starts: np.ndarray, ends: np.ndarray, time_limit=0.05):
+    """Orders strokes to keep the cursor travel between them short.
+
+    `starts` and `ends` are (n, 2) arrays of the points a stroke begins and ends at. Every stroke may be
+    drawn backwards. A nearest neighbour tour is built first and then improved with 2-opt moves until
+    nothing improves or `time_limit` seconds have passed.
+
+    Returns the new order as an index array and a boolean array that tells which strokes (indexed like
+    the input) have to be drawn backwards.
+    """
+    n = len(starts)
+    flipped = np.zeros(n, dtype=bool)
+    if n < 2:
+        return np.arange(n), flipped
+    deadline = time.perf_counter() + time_limit
+    starts = starts.astype(np.float64)
+    ends = ends.astype(np.float64)
+
+    # nearest neighbour: always continue with the closest free endpoint. Endpoints are stacked as
+    # starts followed by ends, and taken ones are moved far away so argmin never picks them again
+    endpoints = np.concatenate([starts, ends])
+    far = np.abs(endpoints).max() * 4 + 1
+    endpoints[[0, n]] = far
+    path = np.empty(n, dtype=np.intp)
+    path[0] = 0
+    cursor = ends[0]
+    for step in range(1, n):
+        k = int(np.argmin(np.square(endpoints - cursor).sum(axis=1)))
+        stroke = k % n
+        path[step] = stroke
+        flipped[stroke] = k >= n
+        cursor = starts[stroke] if k >= n else ends[stroke]
+        endpoints[[stroke, stroke + n]] = far
+
+    # 2-opt: reversing the strokes path[i..j] also reverses the direction of each of them
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(n):
+            if time.perf_counter() >= deadline:
+                break
+            entry = np.where(flipped[path], ends[path].T, starts[path].T).T
+            exit_ = np.where(flipped[path], starts[path].T, ends[path].T).T
+            links = np.zeros(n)
+            links[:-1] = _dist(exit_[:-1], entry[1:])
+            j = np.arange(i, n)
+            old = links[j].copy()
+            new = np.zeros(len(j))
+            new[:-1] = _dist(entry[i], entry[j[:-1] + 1])
+            if i > 0:
+                old += links[i - 1]
+                new += _dist(exit_[i - 1], exit_[j])
+            gain = old - new
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                end = i + best
+                flipped[path[i:end + 1]] ^= True
+                path[i:end + 1] = path[i:end + 1][::-1].copy()
+                improved = True
+    return path, flipped
+
+
+def stroke_endpoints(color_strokes: ColorStrokes):
+    starts = np.array([stroke[0] for stroke in color_strokes.strokes], dtype=np.int32).reshape(-1, 2)
+    ends = np.array([stroke[-1] for stroke in color_strokes.strokes], dtype=np.int32).reshape(-1, 2)
+    return starts, ends
+
+
+def order_color_strokes(color_strokes: ColorStrokes, time_limit=0.05) -> ColorStrokes:
+    path, flipped = order_strokes(*stroke_endpoints(color_strokes), time_limit)
+    strokes = color_strokes.strokes
+    return color_strokes._replace(strokes=[strokes[i][::-1].copy() if flipped[i] else strokes[i] for i in path])
+
+
+def strokes_travel(color_strokes: ColorStrokes) -> float:
+    return travel(*stroke_endpoints(color_strokes))
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+
+PACING_FILE = os.path.join(os.path.expanduser("~"), ".config", "autoskribbler", "pacing.json")
+
+# the kinds of input events a gap can be set for; color, tool and brush are clicks on the palette
+EVENTS = ("move", "press", "release", "click", "color", "tool", "brush")
+
+# minimum seconds after each kind of event before the next event may be sent
+PROFILES = {
+    # the fixed sleeps the drawing loop always had
+    "legacy": {"color": 1.0, "release": 0.0005, "click": 0.0005},
+    "safe": {"color": 0.15, "tool": 0.15, "brush": 0.15, "move": 0.004, "press": 0.004, "release": 0.004,
+             "click": 0.004},
+    "fast": {"color": 0.05, "tool": 0.05, "brush": 0.05, "move": 0.001, "press": 0.001, "release": 0.001,
+             "click": 0.001},
+}
+
+
+def load_profiles(path=PACING_FILE) -> dict:
+    """The built-in profiles plus the ones saved in the pacing file (which win on equal names)."""
+    profiles = {name: dict(gaps) for name, gaps in PROFILES.items()}
+    try:
+        with open(path) as file:
+            profiles.update(json.load(file))
+    except (OSError, ValueError):
+        pass
+    return profiles
+
+
+def save_profile(name, gaps, path=PACING_FILE):
+    saved = {}
+    try:
+        with open(path) as file:
+            saved = json.load(file)
+    except (OSError, ValueError):
+        pass
+    saved[name] = gaps
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(saved, file, indent=2)
+
+
+class Pacer:
+    """Keeps the minimum gap after every kind of event, counted from when that event was sent.
+
+    Time spent elsewhere in between (planning, moving the mouse) counts towards the gap, so nothing ever
+    waits longer than needed.
+    """
+
+    def __init__(self, gaps, clock=time.perf_counter, sleep=time.sleep):
+        self.gaps = gaps
+        self.clock = clock
+        self.sleep = sleep
+        self.last_event = None
+        self.last_time = 0.0
+
+    def wait(self):
+        gap = self.gaps.get(self.last_event, 0)
+        if gap:
+            remaining = self.last_time + gap - self.clock()
+            if remaining > 0:
+                self.sleep(remaining)
+
+    def mark(self, event):
+        self.last_event = event
+        self.last_time = self.clock()
+
+
+class PacedBackend:
+    """An input backend (see backends.py) that sends every event through a Pacer before handing it on.
+
+    Every event sent is counted in `metrics` (see metrics.py), if given.
+    """
+
+    def __init__(self, backend, pacer: Pacer, metrics=None):
+        self.backend = backend
+        self.pacer = pacer
+        self.metrics = metrics
+
+    def _send(self, event, send, *args):
+        self.pacer.wait()
+        send(*args)
+        self.pacer.mark(event)
+        if self.metrics is not None:
+            self.metrics.count(event)
+
+    @property
+    def position(self):
+        return self.backend.position
+
+    @position.setter
+    def position(self, position):
+        self._send("move", setattr, self.backend, "position", position)
+
+    def move(self, dx, dy):
+        self._send("move", self.backend.move, dx, dy)
+
+    def press(self):
+        self._send("press", self.backend.press)
+
+    def release(self):
+        self._send("release", self.backend.release)
+
+    def click(self):
+        self._send("click", self.backend.click)
+
+    def flush(self):
+        self.backend.flush()
+
+    def sleep(self, seconds):
+        self.backend.sleep(seconds)
+
+    def clock(self):
+        return self.backend.clock()
+
+
+def autotune(draw, start=PROFILES["safe"], tolerance=0.001, steps=8, margin=1.25) -> dict:
+    """Finds the smallest gaps at which a drawing still comes out as well as with the `start` gaps.
+
+    `draw(gaps)` draws a calibration plan on a fresh canvas (a virtual one or a test page) and returns its
+    fidelity and the number of events the game dropped. A drawing can come out about as well although
+    events got lost, so gaps at which any are dropped are rejected as well. Every gap is bisected on its
+    own, with the others at their current values; the result keeps `margin` as head room.
+    """
+    gaps = dict(start)
+    reference, dropped = draw(gaps)
+    if dropped:
+        raise ValueError("%d events are dropped with the start gaps already" % dropped)
+    for event in EVENTS:
+        low, high = 0.0, gaps.get(event, 0.0)
+        if not high:
+            continue
+        for _ in range(steps):
+            middle = (low + high) / 2
+            fidelity, dropped = draw(dict(gaps, **{event: middle}))
+            if fidelity >= reference - tolerance and not dropped:
+                high = middle
+            else:
+                low = middle
+        gaps[event] = min(high * margin, start[event])
+    return gaps
@@ -0,0 +1,80 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from planner import ColorStrokes
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+class StrokePipeline:
+    """Plans in a background thread while the drawer already draws what is planned.
+
+    `produce()` yields the colors of a plan in drawing order. They are passed on through a queue of at
+    most `maxsize` colors, so planning never runs far ahead of drawing. Iterating the pipeline starts
+    the planning and yields the colors as they arrive; errors of the planner are raised in the
+    iterating thread. Iterating again (to resume a paused drawing) yields the colors handed out so far
+    first and then goes on with the planner. Setting `cancel` stops both sides at the next color.
+    `waited` adds up the seconds the iterating side spent waiting for the planner.
+    """
+
+    def __init__(self, produce: Callable[[], Iterable[ColorStrokes]], maxsize=4,
+                 cancel: Optional[threading.Event] = None):
+        self.produce = produce
+        self.queue = queue.Queue(maxsize)
+        self.cancel = cancel or threading.Event()
+        self.plan: List[ColorStrokes] = []  # everything handed out so far
+        self.waited = 0.0
+        self._thread = None
+        self._done = False
+
+    def _put(self, item) -> bool:
+        while not self.cancel.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            for color in self.produce():
+                if not self._put(color):
+                    return
+        except Exception as e:
+            self._put(_Failed(e))
+            return
+        self._put(_DONE)
+
+    def __iter__(self) -> Iterator[ColorStrokes]:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        i = 0
+        while not self.cancel.is_set():
+            if i < len(self.plan):
+                yield self.plan[i]
+                i += 1
+                continue
+            if self._done:
+                return
+            start = time.perf_counter()
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            finally:
+                self.waited += time.perf_counter() - start
+            if item is _DONE:
+                self._done = True
+            elif isinstance(item, _Failed):
+                raise item.error
+            else:
+                self.plan.append(item)
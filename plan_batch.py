@@ -0,0 +1,114 @@
+"""Plans many images ahead of time into the plan cache, in parallel and without any GUI.
+
+Takes image files, directories of images and manifests (text files with one image path per line, relative
+to the manifest) and plans every image in a pool of processes. The plans go into the PlanCache, where the
+main window finds them when the same file is drawn with the same options. Stats of every image are
+written as JSON lines.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import budget
+import images
+import ordering
+import pacing
+import planner
+import quantizer
+from plan_cache import PLAN_CACHE_DIR, PlanCache, plan_key
+
+log = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+
+
+def find_images(sources):
+    """The image files of the given files, directories and manifests, in the order they are given."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(os.path.join(source, name) for name in sorted(os.listdir(source))
+                          if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif source.lower().endswith(IMAGE_EXTENSIONS):
+            paths.append(source)
+        else:
+            with open(source) as file:
+                lines = [line.strip() for line in file]
+            paths.extend(os.path.join(os.path.dirname(source), line) for line in lines
+                          if line and not line.startswith("#"))
+    return paths
+
+
+def plan_image(path, options, model: budget.CostModel, cache_dir=PLAN_CACHE_DIR) -> dict:
+    """Plans one image like the main window does and stores the plan; runs in a worker process."""
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        content = file.read()
+    key = plan_key(content, **options)
+    cache = PlanCache(cache_dir)
+    plan = cache.get(key)
+    cached = plan is not None
+    if not cached:
+        idx = planner.quantize(images.decode(path), dither=options["dither"], metric=options["metric"])
+        colors = planner.iter_strokes(idx, options["fill"], options["sizes"], options["progressive"],
+                                      options["contours"])
+        plan = [ordering.order_color_strokes(color) for color in colors]
+        cache.put(key, plan)
+    return {
+        "image": path,
+        "key": key,
+        "cached": cached,
+        "colors": len(plan),
+        "strokes": sum(len(color.strokes) for color in plan),
+        "events": budget.count_events(plan),
+        "travel": round(sum(ordering.strokes_travel(color) for color in plan), 1),
+        "predicted": round(model.predict(plan), 2),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", metavar="IMAGE|DIRECTORY|MANIFEST")
+    parser.add_argument("--fill", action="store_true", help="use the fill bucket for large areas")
+    parser.add_argument("--sizes", action="store_true", help="use bigger brushes for large areas")
+    parser.add_argument("--dither", choices=quantizer.DITHERS, default="floyd-steinberg")
+    parser.add_argument("--metric", choices=quantizer.METRICS, default="rgb", help="color distance for quantizing")
+    parser.add_argument("--progressive", action="store_true", help="draw a rough version first, then refine it")
+    parser.add_argument("--contours", action="store_true", help="only draw outlines, with --fill large areas sparsely")
+    parser.add_argument("--pacing", default="legacy", help="pacing profile the predicted times are for")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="planning processes, one per core")
+    parser.add_argument("--cache-dir", default=PLAN_CACHE_DIR, help="where the plans go")
+    parser.add_argument("--stats", type=argparse.FileType("w"), default=sys.stdout,
+                        help="file for the JSON lines of stats, standard output by default")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # the same options, and so the same cache keys, as the main window uses
+    options = dict(fill=args.fill, sizes=planner.BRUSH_SIZES if args.sizes else None, dither=args.dither,
+                   metric=args.metric, progressive=args.progressive, contours=args.contours)
+    model = budget.CostModel(latency=budget.fit_latency(), gaps=pacing.load_profiles()[args.pacing])
+    paths = find_images(args.sources)
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(plan_image, path, options, model, args.cache_dir): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                stats = future.result()
+            except Exception as e:
+                log.warning("could not plan %s: %s", futures[future], e)
+                failed += 1
+                continue
+            args.stats.write(json.dumps(stats) + "\n")
+            args.stats.flush()
+    log.info("planned %d images in %.1f s with %d workers, %d failed", len(paths) - failed,
+             time.perf_counter() - start, args.workers, failed)
+
+
+if __name__ == "__main__":
+    main()
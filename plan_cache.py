@@ -0,0 +1,99 @@
+import hashlib
+import os
+import struct
+from typing import List, Optional
+
+import numpy as np
+
+import disk_cache
+import planner
+from planner import ColorStrokes
+
+PLAN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "autoskribbler", "plans")
+
+MAGIC = b"ASKP"
+VERSION = 6
+TOOLS = ["brush", "fill"]
+
+# per pass: color, tool, brush size (0 for none), number of strokes
+_PASS = struct.Struct("<BBHI")
+
+
+def dumps(plan: List[ColorStrokes]) -> bytes:
+    """Packs a plan into bytes: per pass a small header, the point count of every stroke and all points.
+
+    Points are stored as int16 in half cells, which is exact for every stroke the planners produce.
+    """
+    chunks = [MAGIC, struct.pack("<HI", VERSION, len(plan))]
+    for color in plan:
+        chunks.append(_PASS.pack(color.color, TOOLS.index(color.tool), color.size or 0, len(color.strokes)))
+        chunks.append(np.array([len(stroke) for stroke in color.strokes], dtype="<u4").tobytes())
+        if color.strokes:
+            points = np.concatenate(color.strokes).astype(np.float32) * 2
+            chunks.append(np.round(points).astype("<i2").tobytes())
+    return b"".join(chunks)
+
+
+def loads(data: bytes) -> List[ColorStrokes]:
+    if data[:4] != MAGIC:
+        raise ValueError("not a drawing plan")
+    version, count = struct.unpack_from("<HI", data, 4)
+    if version != VERSION:
+        raise ValueError("unsupported drawing plan version " + str(version))
+    offset = 10
+    plan = []
+    for _ in range(count):
+        color, tool, size, stroke_count = _PASS.unpack_from(data, offset)
+        offset += _PASS.size
+        lengths = np.frombuffer(data, dtype="<u4", count=stroke_count, offset=offset)
+        offset += lengths.nbytes
+        total = int(lengths.sum())
+        points = np.frombuffer(data, dtype="<i2", count=total * 2, offset=offset).reshape(total, 2)
+        offset += points.nbytes
+        if np.any(points % 2):
+            points = points.astype(np.float32) / 2
+        else:
+            points = (points // 2).astype(np.int16)
+        strokes = np.split(points, np.cumsum(lengths)[:-1]) if stroke_count else []
+        plan.append(ColorStrokes(color=color, strokes=strokes, tool=TOOLS[tool], size=size or None))
+    return plan
+
+
+def plan_key(content: bytes, **options) -> str:
+    """Cache key of a plan: the image content, the palette, the grid size and the planner options."""
+    digest = hashlib.sha256()
+    digest.update(content)
+    digest.update(repr((VERSION, planner.PALETTE, planner.DRAW_SIZE, planner.CELL_SIZE, sorted(options.items())))
+                  .encode())
+    return digest.hexdigest()
+
+
+class PlanCache:
+    """Plans on disk, one file per key. The least recently used ones go once the cache outgrows max_bytes."""
+
+    def __init__(self, directory=PLAN_CACHE_DIR, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".plan")
+
+    def get(self, key) -> Optional[List[ColorStrokes]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                plan = loads(file.read())
+        except (OSError, ValueError, struct.error):
+            return None
+        os.utime(path)  # the modification time doubles as the last use
+        return plan
+
+    def put(self, key, plan: List[ColorStrokes]):
+        def write(path):
+            with open(path, "wb") as file:
+                file.write(dumps(plan))
+        disk_cache.write_atomically(self._path(key), write)
+        self.evict()
+
+    def evict(self):
+        disk_cache.evict(self.directory, self.max_bytes, (".plan",))
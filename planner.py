@@ -0,0 +1,641 @@
+from typing import Iterator, List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import quantizer
+import vectorize
+
+# skribbl.io colors in the order of the palette buttons (top row left to right, then bottom row)
+PALETTE = [
+    (255, 255, 255), (193, 193, 193), (239, 19, 11), (255, 115, 0), (255, 228, 0), (0, 204, 0),
+    (0, 178, 255), (35, 31, 211), (163, 0, 186), (211, 124, 170), (160, 82, 45),
+    (0, 0, 0), (76, 76, 76), (116, 11, 7), (194, 56, 0), (232, 162, 0), (0, 85, 16),
+    (0, 86, 158), (14, 8, 101), (85, 0, 105), (167, 85, 116), (99, 48, 13),
+]
+WHITE = 0
+BLACK = 11
+NO_SKIP = len(PALETTE)  # a skip color that never occurs, for plans that have to draw white as well
+
+DRAW_SIZE = (133, 100)
+CELL_SIZE = 6  # canvas pixels per pixel of the drawing grid
+BRUSH_SIZES = (4, 10, 20, 40)  # diameters of skribbl's brushes in canvas pixels
+SWITCH_EVENTS = 8  # mouse events for picking a color and a brush, two moves, press and release each
+LUMINANCE = np.array([0.299 * r + 0.587 * g + 0.114 * b for r, g, b in PALETTE])  # brightness of every color
+
+
+class ColorRuns(NamedTuple):
+    """All horizontal runs of one palette color, in raster order."""
+    color: int  # index into PALETTE
+    xs: np.ndarray  # column of the leftmost pixel of each run
+    ys: np.ndarray  # row of each run
+    lengths: np.ndarray  # number of pixels in each run
+
+
+class ColorStrokes(NamedTuple):
+    """The strokes of one palette color, in the order they are drawn."""
+    color: int  # index into PALETTE
+    # one (k, 2) array of (x, y) cells per stroke: pressed at the first cell, dragged through the others.
+    # Strokes of brushes that cover an even number of cells are centered between cells, on halves.
+    strokes: List[np.ndarray]
+    tool: str = "brush"  # "brush" or "fill"; fill strokes are single clicks with the bucket
+    size: Optional[int] = None  # brush diameter in canvas pixels, None keeps the selected brush
+
+
+def palette_image() -> Image:
+    colors = [c for rgb in PALETTE for c in rgb]
+    # adding placeholders because Pillow pallets need to have exactly 768 values
+    colors += [0] * (768 - len(colors))
+    pal_image = Image.new("P", (16, 16))
+    pal_image.putpalette(colors)
+    return pal_image
+
+
+def quantize(img: Image, size=DRAW_SIZE, dither="floyd-steinberg", metric="rgb") -> np.ndarray:
+    """Scales the image down to the drawing grid and returns it as an array of PALETTE indices.
+
+    `dither` and `metric` select the quantizer, see quantizer.quantize_array.
+    """
+    img = img.copy()
+    img.thumbnail(size, Image.NEAREST)
+    img = img.convert("RGB")
+    if dither == "floyd-steinberg" and metric == "rgb":
+        # that is exactly what Pillow's own quantizer does
+        idx = np.asarray(img.quantize(palette=palette_image()), dtype=np.uint8)
+        # the placeholder entries of the palette are black as well
+        return np.where(idx < len(PALETTE), idx, BLACK).astype(np.uint8)
+    return quantizer.quantize_array(np.asarray(img), dither, metric)
+
+
+def plan_runs(idx: np.ndarray, skip=WHITE) -> List[ColorRuns]:
+    """Splits every row into maximal runs of the same color and groups them by color.
+
+    Colors come out in the order they first appear in the image, runs of a color in raster order.
+    Runs of the `skip` color are dropped (the canvas is white already).
+    """
+    height, width = idx.shape
+    is_start = np.ones((height, width), dtype=bool)
+    is_start[:, 1:] = idx[:, 1:] != idx[:, :-1]
+    starts = np.flatnonzero(is_start)
+    # every row begins with a run start, so runs never wrap into the next row
+    lengths = np.diff(np.append(starts, height * width))
+    colors = idx.ravel()[starts]
+
+    keep = colors != skip
+    starts, lengths, colors = starts[keep], lengths[keep], colors[keep]
+    if not len(starts):
+        return []
+
+    order = np.argsort(colors, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(colors[order])) + 1)
+    # a stable sort keeps raster order inside a group, so group[0] is the color's first appearance
+    groups.sort(key=lambda group: group[0])
+
+    return [
+        ColorRuns(
+            color=int(colors[group[0]]),
+            xs=(starts[group] % width).astype(np.int16),
+            ys=(starts[group] // width).astype(np.int16),
+            lengths=lengths[group].astype(np.int16),
+        )
+        for group in groups
+    ]
+
+
+def _link_runs(xs, ys, lengths, reach, step=1):
+    """Links every run to at most one run `step` rows below that it touches, preferring the largest overlap.
+
+    Returns the chains of linked runs as lists of run indices.
+    """
+    successor = [-1] * len(xs)
+    has_predecessor = [False] * len(xs)
+    rows = {}
+    for i, y in enumerate(ys):
+        rows.setdefault(y, []).append(i)  # runs come in raster order, so every row is sorted by x
+
+    for y, row in rows.items():
+        below = rows.get(y + step)
+        if not below:
+            continue
+        first = 0
+        for i in row:
+            a, b = xs[i], xs[i] + lengths[i] - 1
+            while first < len(below) and xs[below[first]] + lengths[below[first]] - 1 < a - reach:
+                first += 1
+            best, best_overlap = -1, None
+            k = first
+            while k < len(below) and xs[below[k]] <= b + reach:
+                j = below[k]
+                overlap = min(b, xs[j] + lengths[j] - 1) - max(a, xs[j])
+                if not has_predecessor[j] and (best_overlap is None or overlap > best_overlap):
+                    best, best_overlap = j, overlap
+                k += 1
+            if best >= 0:
+                successor[i] = best
+                has_predecessor[best] = True
+
+    chains = []
+    for i in range(len(xs)):
+        if not has_predecessor[i]:
+            chain = [i]
+            while successor[chain[-1]] >= 0:
+                chain.append(successor[chain[-1]])
+            chains.append(chain)
+    return chains
+
+
+def _snake(chain, xs, ys, lengths, reach) -> np.ndarray:
+    """Builds one zig-zag drag that covers every run of a chain, row after row."""
+    points = []
+    entry = None
+    for pos, i in enumerate(chain):
+        a, b, y = xs[i], xs[i] + lengths[i] - 1, ys[i]
+        if pos + 1 < len(chain):
+            nxt = chain[pos + 1]
+            next_a, next_b = xs[nxt], xs[nxt] + lengths[nxt] - 1
+            # columns of this run we can step down from without leaving the color
+            lo, hi = max(a, next_a - reach), min(b, next_b + reach)
+        else:
+            lo, hi = a, b
+        best = None
+        for near, far in ((a, b), (b, a)):
+            start = near if entry is None else entry
+            leave = min(max(far, lo), hi)
+            path = [start, near, far, leave]
+            length = sum(abs(p - q) for p, q in zip(path, path[1:]))
+            if best is None or length < best[0]:
+                best = (length, path)
+        points.extend((x, y) for x in best[1])
+        if pos + 1 < len(chain):
+            entry = min(max(best[1][-1], next_a), next_b)
+    return _simplify(points)
+
+
+def _simplify(points) -> np.ndarray:
+    """Drops repeated points and points in the middle of a straight segment."""
+    kept = []
+    for p in points:
+        if kept and p == kept[-1]:
+            continue
+        if len(kept) >= 2:
+            (x0, y0), (x1, y1) = kept[-2], kept[-1]
+            dx0, dy0, dx1, dy1 = x1 - x0, y1 - y0, p[0] - x1, p[1] - y1
+            if dx0 * dy1 == dy0 * dx1 and dx0 * dx1 + dy0 * dy1 > 0:
+                kept[-1] = p
+                continue
+        kept.append(p)
+    return np.array(kept, dtype=np.int16)
+
+
+def _decompose_runs(runs: ColorRuns, reach) -> List[np.ndarray]:
+    xs, ys, lengths = runs.xs.tolist(), runs.ys.tolist(), runs.lengths.tolist()
+    return [_snake(chain, xs, ys, lengths, reach) for chain in _link_runs(xs, ys, lengths, reach)]
+
+
+def iter_decompose(idx: np.ndarray, skip=WHITE, diagonal=True, mask=None, size=None) -> Iterator[ColorStrokes]:
+    """Covers the pixels of every color with as few press/drag/release gestures as possible.
+
+    Runs in touching rows are chained into one zig-zag drag, which turns horizontal, vertical and (with
+    `diagonal`) diagonal lines as well as filled rectangles and blobs into single strokes. This is done
+    once row by row and once column by column, and every color keeps whichever needs fewer strokes.
+    If a boolean `mask` is given, only the pixels where it is set are drawn. Colors are yielded as soon
+    as they are planned, for the brush of diameter `size`, by default the smallest that covers a pixel.
+    The size is always set, so that a bigger brush left selected by an earlier drawing is not used.
+    """
+    size = _detail_brush() if size is None else size
+    if mask is not None:
+        idx = np.where(mask, idx, skip)
+    reach = 1 if diagonal else 0
+    by_columns = {runs.color: runs for runs in plan_runs(idx.T, skip)}
+    for runs in plan_runs(idx, skip):
+        strokes = _decompose_runs(runs, reach)
+        column_strokes = [np.ascontiguousarray(s[:, ::-1]) for s in _decompose_runs(by_columns[runs.color], reach)]
+        if (len(column_strokes), sum(map(len, column_strokes))) < (len(strokes), sum(map(len, strokes))):
+            strokes = column_strokes
+        yield ColorStrokes(color=runs.color, strokes=strokes, size=size)
+
+
+def decompose(idx: np.ndarray, skip=WHITE, diagonal=True, mask=None, size=None) -> List[ColorStrokes]:
+    """All of iter_decompose at once."""
+    return list(iter_decompose(idx, skip, diagonal, mask, size))
+
+
+def label_components(idx: np.ndarray, diagonal=True):
+    """Labels every connected area of equal values (8-connected with `diagonal`, 4-connected otherwise).
+
+    Returns an array of labels shaped like `idx` and the number of labels.
+    """
+    height, width = idx.shape
+    is_start = np.ones((height, width), dtype=bool)
+    is_start[:, 1:] = idx[:, 1:] != idx[:, :-1]
+    starts = np.flatnonzero(is_start)
+    lengths = np.diff(np.append(starts, height * width))
+    values = idx.ravel()[starts].tolist()
+    xs = (starts % width).tolist()
+    ends = (starts % width + lengths - 1).tolist()
+    row_first = np.searchsorted(starts // width, np.arange(height + 1)).tolist()
+    reach = 1 if diagonal else 0
+
+    parent = list(range(len(xs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for y in range(height - 1):
+        first, below_end = row_first[y + 1], row_first[y + 2]
+        for i in range(row_first[y], row_first[y + 1]):
+            while first < below_end and ends[first] < xs[i] - reach:
+                first += 1
+            j = first
+            while j < below_end and xs[j] <= ends[i] + reach:
+                if values[j] == values[i]:
+                    parent[find(j)] = find(i)
+                j += 1
+
+    roots = np.array([find(i) for i in range(len(xs))])
+    _, run_labels = np.unique(roots, return_inverse=True)
+    labels = np.repeat(run_labels, lengths).reshape(height, width)
+    return labels, int(run_labels.max()) + 1
+
+
+def _dilate(mask: np.ndarray, outside=False) -> np.ndarray:
+    """Grows a boolean mask by one pixel in all 8 directions; `outside` is assumed around the image."""
+    height, width = mask.shape
+    padded = np.pad(mask, 1, constant_values=outside)
+    grown = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            grown |= padded[dy:dy + height, dx:dx + width]
+    return grown
+
+
+def _count_runs(mask: np.ndarray) -> int:
+    """Number of runs the brush needs for a mask, row or column wise, whichever is less."""
+    rows = np.count_nonzero(mask[:, 0]) + np.count_nonzero(mask[:, 1:] & ~mask[:, :-1])
+    columns = np.count_nonzero(mask[0]) + np.count_nonzero(mask[1:] & ~mask[:-1])
+    return int(min(rows, columns))
+
+
+def _depths(mask: np.ndarray) -> np.ndarray:
+    """Chessboard distance of every pixel of the mask to the nearest pixel outside it, 1 right next to it."""
+    depth = np.zeros(mask.shape, dtype=np.int32)
+    inside = mask.copy()
+    d = 0
+    while inside.any():
+        d += 1
+        depth[inside] = d
+        inside &= ~_dilate(~inside, outside=True)
+    return depth
+
+
+def _seed_depth(size, cell) -> int:
+    """How deep inside an area a fill has to be seeded so that a brush of diameter `size` can't paint over it.
+
+    The brush runs through the centers of the pixels outside; between two diagonal neighbours it comes
+    closest, (d - 1/2) * sqrt(2) pixels from a seed at depth d.
+    """
+    d = 1
+    while min(d, (d - 0.5) * np.sqrt(2)) * cell <= size / 2:
+        d += 1
+    return d
+
+
+def _detail_brush(sizes=BRUSH_SIZES, cell=CELL_SIZE) -> int:
+    """The smallest brush that still covers a pixel of the drawing grid."""
+    return min(size for size in sizes if size >= cell)
+
+
+def _fill_areas(idx, labels, label_colors, candidates, skip, min_depth):
+    """Outlines and seeds the candidate areas in the given order, keeping only those worth filling.
+
+    Every enclosed piece of an area is seeded at its deepest pixel, and left to the brush if that is not
+    at least `min_depth` deep. Returns the fills as (label, color, seeds, labels of the fills it has to
+    wait for) and a mask of the pixels left to the brush.
+    """
+    rank = np.full(len(label_colors), len(candidates))
+    rank[candidates] = np.arange(len(candidates))
+    pixel_rank = rank[labels]
+
+    brush_mask = idx != skip
+    fills = []
+    for i, label in enumerate(candidates):
+        component = labels == label
+        # earlier candidates are either filled already or left to the brush, later ones are still white
+        still_white = (idx == skip) | (pixel_rank > i)
+        interior = component & ~_dilate(still_white, outside=True)
+        if not interior.any():
+            continue
+        pieces, _ = label_components(interior.astype(np.uint8), diagonal=False)
+        depth = _depths(interior)
+        # the first pixel of every piece in order of decreasing depth is its deepest
+        deepest = np.argsort(-depth.ravel(), kind="stable")
+        piece_labels, first = np.unique(np.where(interior, pieces, -1).ravel()[deepest], return_index=True)
+        seeds = deepest[first[piece_labels >= 0]]
+        deep = depth.ravel()[seeds] >= min_depth
+        interior &= np.isin(pieces, piece_labels[piece_labels >= 0][deep])
+        seeds = seeds[deep]
+        if not len(seeds) or _count_runs(component & ~interior) + len(seeds) >= _count_runs(component):
+            continue  # the outline alone would take as many strokes as drawing the whole area
+        seeds = [np.array([[p % idx.shape[1], p // idx.shape[1]]], dtype=np.int16) for p in seeds.tolist()]
+        # areas drawn by the brush are done before any fill, so only earlier fills have to be waited for
+        neighbours = set(np.unique(labels[_dilate(component) & (pixel_rank < i)]).tolist())
+        fills.append((label, int(label_colors[label]), seeds, neighbours & {fill[0] for fill in fills}))
+        brush_mask &= ~interior
+    return fills, brush_mask
+
+
+def plan_fills(idx: np.ndarray, min_area=64, skip=WHITE, diagonal=True, sizes=None,
+               cell=CELL_SIZE, switch=SWITCH_EVENTS) -> List[ColorStrokes]:
+    """Paints large areas with the fill bucket and everything else with the brush.
+
+    Every connected area of at least `min_area` pixels gets a one pixel outline wherever it touches a
+    pixel that is still white when the area is filled, and the rest of it is filled with one click per
+    enclosed piece, unless the outline would not be cheaper than drawing the whole area with the brush.
+    Areas are decided smallest first, so small details next to a large area are usually left to the
+    brush and the large area needs no outline towards them. Outside the image counts as white. The brush
+    draws all outlines and remaining detail first; fills follow in an order in which every fill only
+    borders on pixels that have been painted already, so none of them can leak.
+
+    The brush is the smallest that covers a pixel of the drawing grid, so that neighbouring outline
+    pixels close up on the canvas. It also paints a little beyond them, so fills are seeded deep enough
+    inside that it can't reach the seed. With `sizes`, the brush work is planned by plan_brush_sizes.
+    """
+    labels, count = label_components(idx, diagonal)
+    areas = np.bincount(labels.ravel(), minlength=count)
+    label_colors = np.zeros(count, dtype=np.uint8)
+    label_colors[labels.ravel()] = idx.ravel()
+    candidates = [int(label) for label in np.argsort(areas, kind="stable")
+                  if areas[label] >= min_area and label_colors[label] != skip]
+    detail = _detail_brush(sizes or BRUSH_SIZES, cell)
+    fills, brush_mask = _fill_areas(idx, labels, label_colors, candidates, skip, _seed_depth(detail, cell))
+
+    if sizes:
+        plan = plan_brush_sizes(idx, sizes, cell, skip, diagonal, mask=brush_mask, switch=switch)
+    else:
+        plan = decompose(idx, skip, diagonal, mask=brush_mask, size=detail)
+    filled = set()
+    color = None
+    # fills of one color never touch each other, so a color keeps going for as long as any of its fills is ready
+    while fills:
+        ready = [fill for fill in fills if fill[3] <= filled]
+        if color not in [fill[1] for fill in ready]:
+            color = ready[0][1]
+        batch = [fill for fill in ready if fill[1] == color]
+        if plan and plan[-1].tool == "fill" and plan[-1].color == color:
+            plan[-1].strokes.extend(seed for fill in batch for seed in fill[2])
+        else:
+            plan.append(ColorStrokes(color=color, strokes=[seed for fill in batch for seed in fill[2]], tool="fill"))
+        filled.update(fill[0] for fill in batch)
+        fills = [fill for fill in fills if fill not in batch]
+    return plan
+
+
+def _brush_bands(mask: np.ndarray, uncovered: np.ndarray, k) -> List[np.ndarray]:
+    """Sweeps a brush that covers k x k pixels over the mask in horizontal bands, top to bottom.
+
+    A band is only drawn where every block it covers lies inside the mask and where it paints at least
+    one full block worth of pixels that are still uncovered. Bands exactly k rows apart that overlap are
+    chained into zig-zags. Covered pixels are cleared in `uncovered`.
+    """
+    height, width = mask.shape
+    if height < k or width < k:
+        return []
+    integral = np.pad(mask.astype(np.int32).cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    # fits[y, x]: the block with its top left pixel at (x, y) lies inside the mask
+    fits = (integral[k:, k:] - integral[:-k, k:] - integral[k:, :-k] + integral[:-k, :-k]) == k * k
+    xs, ys, lengths = [], [], []
+    for y in range(height - k + 1):
+        if not fits[y].any():
+            continue
+        # only start a band where the top row of the block still has something to paint, so bands
+        # end up k rows apart instead of overlapping row after row
+        top = np.concatenate([[0], np.cumsum(uncovered[y])])
+        useful = fits[y] & (top[k:] - top[:-k] > 0)
+        edges = np.diff(np.concatenate([[0], useful.astype(np.int8), [0]]))
+        for a, b in zip(np.flatnonzero(edges == 1).tolist(), (np.flatnonzero(edges == -1) - 1).tolist()):
+            if np.count_nonzero(uncovered[y:y + k, a:b + k]) < k * k:
+                continue
+            uncovered[y:y + k, a:b + k] = False
+            xs.append(a)
+            ys.append(y)
+            lengths.append(b - a + 1)
+    # a block fits at every column two chained bands share, so the drag between them stays inside the mask
+    center = (k - 1) / 2
+    return [_snake(chain, xs, ys, lengths, 0) + np.float32(center)
+            for chain in _link_runs(xs, ys, lengths, 0, step=k)]
+
+
+def _cost(strokes) -> int:
+    """Mouse events needed for a list of strokes: press and release plus one move per further point."""
+    return sum(len(stroke) + 1 for stroke in strokes)
+
+
+def plan_brush_sizes(idx: np.ndarray, sizes=BRUSH_SIZES, cell=CELL_SIZE, skip=WHITE, diagonal=True,
+                     mask=None, switch=SWITCH_EVENTS) -> List[ColorStrokes]:
+    """Paints the inside of uniform areas with big brushes and leaves edges and detail to the small one.
+
+    A brush of diameter d covers d // cell pixels of the drawing grid in each direction. Going from the
+    biggest brush down, every color gets horizontal bands wherever a whole block of the brush fits inside
+    it. Whatever is left is decomposed for the smallest brush that still covers a pixel. Every band size
+    and the leftover are a pass of their own, and every pass costs `switch` mouse events for picking its
+    color and brush, which pacing with long gaps after palette clicks makes many more than the eight
+    clicks themselves (see budget.CostModel.switch_events). A color for which all of this takes at least
+    as many events as one pass with the small brush is drawn with the small brush only. Big brushes overshoot their blocks by less than half a pixel, so all of them are
+    used before the detail brush, which then paints over any overshoot along the edges.
+    """
+    usable = sorted(size for size in sizes if size >= cell)
+    detail = _detail_brush(sizes, cell)
+    if mask is None:
+        mask = idx != skip
+    mask = mask & (idx != skip)
+    uncovered = mask.copy()
+    colors, first = np.unique(idx[mask], return_index=True)
+    colors = colors[np.argsort(first)].tolist()
+
+    bands = {color: [] for color in colors}  # color -> [(size, strokes)]
+    for size in reversed(usable[1:]):
+        k = size // cell
+        for color in colors:
+            strokes = _brush_bands(mask & (idx == color), uncovered, k)
+            if strokes:
+                bands[color].append((size, strokes))
+
+    leftover = {color.color: color.strokes for color in decompose(idx, skip, diagonal, mask=uncovered)}
+    small_only = {color.color: color.strokes for color in decompose(idx, skip, diagonal, mask=mask)}
+    plan, details = [], []
+    for color in colors:
+        passes = len(bands[color]) + (color in leftover)
+        big_cost = sum(_cost(strokes) for _, strokes in bands[color]) + _cost(leftover.get(color, []))
+        if big_cost + passes * switch < _cost(small_only[color]) + switch:
+            plan.extend(ColorStrokes(color=color, strokes=strokes, size=size) for size, strokes in bands[color])
+            if color in leftover:
+                details.append(ColorStrokes(color=color, strokes=leftover[color], size=detail))
+        else:
+            details.append(ColorStrokes(color=color, strokes=small_only[color], size=detail))
+    # keep the big brushes together so the brush size changes as rarely as possible
+    plan.sort(key=lambda color: -color.size)
+    return plan + details
+
+
+def _block_sums(mask: np.ndarray, f) -> np.ndarray:
+    """Number of set pixels in every f x f block; blocks at the right and bottom edges may be cut off."""
+    height, width = mask.shape
+    h, w = -(-height // f), -(-width // f)
+    padded = np.pad(mask, ((0, h * f - height), (0, w * f - width)))
+    return padded.reshape(h, f, w, f).sum(axis=(1, 3))
+
+
+def _paint(painter: ImageDraw.ImageDraw, strokes, color, size, cell):
+    """Draws strokes onto a canvas the way the Drawer does: a round dot where the brush goes down and
+    lines of the brush's width between the points, each point at `cell` canvas pixels per grid pixel."""
+    r = size / 2
+    for stroke in strokes:
+        points = [(round(x * cell), round(y * cell)) for x, y in stroke]
+        painter.ellipse((points[0][0] - r, points[0][1] - r, points[0][0] + r, points[0][1] + r), fill=color)
+        for a, b in zip(points, points[1:]):
+            painter.line([a, b], fill=color, width=size)
+            painter.ellipse((b[0] - r, b[1] - r, b[0] + r, b[1] + r), fill=color)
+
+
+def _painted(canvas: Image, plan: List[ColorStrokes], cell) -> Image:
+    """A copy of the canvas with the plan's strokes painted onto it."""
+    canvas = canvas.copy()
+    painter = ImageDraw.Draw(canvas)
+    for color in plan:
+        _paint(painter, color.strokes, color.color, color.size, cell)
+    return canvas
+
+
+def _wrong_pixels(canvas: Image, idx: np.ndarray, cell) -> np.ndarray:
+    """Canvas pixels of every grid pixel that differ from it, a grid pixel being the square centered where it is drawn."""
+    height, width = idx.shape
+    ys = (np.arange(canvas.height) + cell // 2) // cell
+    xs = (np.arange(canvas.width) + cell // 2) // cell
+    ys, xs = ys[ys < height], xs[xs < width]
+    cells = ys[:, None] * width + xs[None, :]
+    wrong = np.asarray(canvas)[:len(ys), :len(xs)] != idx.ravel()[cells]
+    return np.bincount(cells[wrong], minlength=height * width).reshape(height, width)
+
+
+def iter_progressive(idx: np.ndarray, factors=(4, 2), sizes=BRUSH_SIZES, cell=CELL_SIZE,
+                     switch=SWITCH_EVENTS) -> Iterator[List[ColorStrokes]]:
+    """Plans a rough version of the image first, then passes that only redraw what is still wrong.
+
+    For every factor f, the image is scaled down to blocks of f x f pixels in their most common color,
+    which are drawn with the smallest brush that covers a block. A block is only drawn if that leaves
+    fewer of its pixels wrong than the passes before. The canvas is predicted by painting the strokes
+    the way the brush does, and as the brush spills over the edges of its blocks, a pass is left out
+    unless it leaves fewer canvas pixels wrong than before. The last pass draws every pixel that any
+    canvas pixel of is still wrong, white ones included, at full resolution with plan_brush_sizes
+    (`switch` as there). Its brush spills onto the pixels around them as well, which spoils those that
+    were right, so it redraws these too if the prediction has that leave fewer canvas pixels wrong.
+    Every pass is a plan of its own, yielded as soon as it is planned.
+
+    The rough passes cost extra strokes and palette clicks, so the whole drawing takes longer than
+    plan_strokes would. That pays off for undithered images under fast pacing, where the rough version
+    is up within a fraction of the time. Dithered pixels seldom agree with their block, and under
+    pacing with long gaps after palette clicks the extra colors of every pass take most of the time.
+    """
+    height, width = idx.shape
+    canvas = Image.new("P", (width * cell, height * cell), WHITE)  # what the canvas is predicted to look like
+    wrong = _wrong_pixels(canvas, idx, cell)
+    for f in factors:
+        size = min([size for size in sizes if size >= f * cell] or [max(sizes)])
+        counts = np.stack([_block_sums(idx == color, f) for color in range(len(PALETTE))])
+        coarse = np.argmax(counts, axis=0).astype(np.uint8)
+        target = coarse.repeat(f, axis=0).repeat(f, axis=1)[:height, :width]
+        redraw = _block_sums(target != idx, f) < _block_sums(wrong > 0, f)
+        # block centers, kept on the canvas so that no click lands outside of it
+        plan = [ColorStrokes(color=color.color, size=size,
+                             strokes=[np.minimum(stroke * f + (f - 1) / 2, [width - 1, height - 1]).astype(np.float32)
+                                      for stroke in color.strokes])
+                for color in decompose(coarse, NO_SKIP, mask=redraw)]
+        painted = _painted(canvas, plan, cell)
+        painted_wrong = _wrong_pixels(painted, idx, cell)
+        if plan and painted_wrong.sum() < wrong.sum():
+            canvas, wrong = painted, painted_wrong
+            yield plan
+    plan = plan_brush_sizes(idx, sizes, cell, skip=NO_SKIP, mask=wrong > 0, switch=switch)
+    painted_wrong = _wrong_pixels(_painted(canvas, plan, cell), idx, cell)
+    spoiled = (painted_wrong > 0) & (wrong == 0)
+    if spoiled.any():
+        wider = plan_brush_sizes(idx, sizes, cell, skip=NO_SKIP, mask=(wrong > 0) | spoiled, switch=switch)
+        if _wrong_pixels(_painted(canvas, wider, cell), idx, cell).sum() < painted_wrong.sum():
+            plan = wider
+    yield plan
+
+
+def plan_progressive(idx: np.ndarray, factors=(4, 2), sizes=BRUSH_SIZES, cell=CELL_SIZE,
+                     switch=SWITCH_EVENTS) -> List[List[ColorStrokes]]:
+    """All passes of iter_progressive at once."""
+    return list(iter_progressive(idx, factors, sizes, cell, switch))
+
+
+def plan_contours(idx: np.ndarray, fill=False, sizes=BRUSH_SIZES, cell=CELL_SIZE, min_length=3, epsilon=0.75,
+                  min_area=64) -> List[ColorStrokes]:
+    """Draws the outlines of the image as black lines, every one of them a single drag, like a sketch.
+
+    Boundaries between colors are marked on their darker side, thinned to lines one pixel wide and
+    traced into polylines (see vectorize.py), which are simplified until they are at most `epsilon`
+    pixels off. Lines shorter than `min_length` pixels are dropped, and with them most of the noise of
+    dithering. With `fill`, areas of one color of at least `min_area` pixels are filled sparsely before
+    the outlines: with bands of the brushes that cover two pixels or more, wherever a whole block of the
+    brush fits inside, and not at all along the edges.
+    """
+    usable = sorted(size for size in sizes if size >= cell)
+    plan = []
+    if fill:
+        labels, count = label_components(idx)
+        large = (np.bincount(labels.ravel(), minlength=count) >= min_area)[labels] & (idx != WHITE)
+        uncovered = large.copy()
+        colors, first = np.unique(idx[large], return_index=True)
+        for size in reversed(usable[1:]):
+            for color in colors[np.argsort(first)].tolist():
+                strokes = _brush_bands(large & (idx == color), uncovered, size // cell)
+                if strokes:
+                    plan.append(ColorStrokes(color=color, strokes=strokes, size=size))
+    # outside the image counts as white, so areas along its border get closed outlines
+    outlines = vectorize.edges(np.pad(idx, 1, constant_values=WHITE), LUMINANCE)[1:-1, 1:-1]
+    lines = vectorize.trace(vectorize.thin(outlines))
+    strokes = [vectorize.simplify(line, epsilon) for line in lines if len(line) >= min_length]
+    if strokes:
+        plan.append(ColorStrokes(color=BLACK, strokes=strokes, size=usable[0]))
+    return plan
+
+
+def plan_strokes(idx: np.ndarray, fill=False, sizes=None, contours=False,
+                 switch=SWITCH_EVENTS) -> List[ColorStrokes]:
+    """Plans with the fill bucket and/or several brush sizes, or with just the small brush.
+
+    With `contours`, only the outlines are drawn (see plan_contours), and `fill` fills large areas sparsely.
+    `switch` is what a further pass costs the brush size planner, in mouse events (see plan_brush_sizes).
+    """
+    if contours:
+        return plan_contours(idx, fill, sizes or BRUSH_SIZES)
+    if fill:
+        return plan_fills(idx, sizes=sizes, switch=switch)
+    if sizes:
+        return plan_brush_sizes(idx, sizes, switch=switch)
+    return decompose(idx)
+
+
+def iter_strokes(idx: np.ndarray, fill=False, sizes=None, progressive=False,
+                 contours=False, switch=SWITCH_EVENTS) -> Iterator[ColorStrokes]:
+    """The colors of plan_strokes or plan_progressive, yielded as early as the planner allows.
+
+    The small brush and the progressive planner hand out colors or passes while they plan the rest;
+    fill, brush size and contour plans are decided as a whole before the first color comes. Contours
+    are drawn at once, a progressive pass would not make them any faster.
+    """
+    if contours:
+        yield from plan_strokes(idx, fill, sizes, contours)
+    elif progressive:
+        for plan in iter_progressive(idx, switch=switch):
+            yield from plan
+    elif fill or sizes:
+        yield from plan_strokes(idx, fill, sizes, switch=switch)
+    else:
+        yield from iter_decompose(idx)
@@ -0,0 +1,85 @@
+import functools
+
+import numpy as np
+
+import planner
+
+LUT_BITS = 6  # the lookup table has 2 ** LUT_BITS entries per channel
+METRICS = ("rgb", "lab")
+DITHERS = ("none", "ordered", "floyd-steinberg")
+
+# 4x4 Bayer matrix, scaled to thresholds in [-0.5, 0.5)
+BAYER = (np.array([[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]) + 0.5) / 16 - 0.5
+ORDERED_SPREAD = 48  # how far ordered dithering may push a channel, in 0..255 units
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Converts sRGB values (0..255, last axis RGB) to CIELAB under D65."""
+    c = np.asarray(rgb, dtype=np.float64) / 255
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ np.array([[0.4124, 0.2126, 0.0193], [0.3576, 0.7152, 0.1192], [0.1805, 0.0722, 0.9505]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_table(metric="rgb") -> np.ndarray:
+    """PALETTE index of the closest color for every RGB value, indexed by the top LUT_BITS of each channel."""
+    shift = 8 - LUT_BITS
+    levels = (np.arange(2 ** LUT_BITS) << shift) + (1 << shift >> 1)  # centers of the bins
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+    palette = np.array(planner.PALETTE, dtype=np.float64)
+    if metric == "lab":
+        grid, palette = rgb_to_lab(grid), rgb_to_lab(palette)
+    # a running minimum over the palette, the distances to all colors at once would take hundreds of MB
+    best = np.full(len(grid), np.inf)
+    table = np.zeros(len(grid), dtype=np.uint8)
+    for i, color in enumerate(palette):
+        distances = ((grid - color) ** 2).sum(axis=1)
+        closer = distances < best  # ties keep the earlier color, like argmin
+        best[closer] = distances[closer]
+        table[closer] = i
+    size = 2 ** LUT_BITS
+    return table.reshape(size, size, size)
+
+
+def _lookup(rgb: np.ndarray, metric) -> np.ndarray:
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8) >> (8 - LUT_BITS)
+    return lookup_table(metric)[rgb[..., 0], rgb[..., 1], rgb[..., 2]]
+
+
+def _error_diffusion(rgb: np.ndarray, metric) -> np.ndarray:
+    """Floyd-Steinberg: pushes the error of every pixel onto its unvisited neighbours."""
+    height, width, _ = rgb.shape
+    work = rgb.astype(np.float64).tolist()
+    lut = lookup_table(metric)
+    palette = planner.PALETTE
+    shift = 8 - LUT_BITS
+    idx = np.empty((height, width), dtype=np.uint8)
+    for y in range(height):
+        row = work[y]
+        below = work[y + 1] if y + 1 < height else None
+        for x in range(width):
+            pixel = [min(max(v, 0.0), 255.0) for v in row[x]]
+            i = lut[int(pixel[0]) >> shift, int(pixel[1]) >> shift, int(pixel[2]) >> shift]
+            idx[y, x] = i
+            error = [pixel[c] - palette[i][c] for c in range(3)]
+            for dx, dy, weight in ((1, 0, 7 / 16), (-1, 1, 3 / 16), (0, 1, 5 / 16), (1, 1, 1 / 16)):
+                nx = x + dx
+                if 0 <= nx < width and (dy == 0 or below is not None):
+                    target = (row if dy == 0 else below)[nx]
+                    for c in range(3):
+                        target[c] += error[c] * weight
+    return idx
+
+
+def quantize_array(rgb: np.ndarray, dither="none", metric="rgb") -> np.ndarray:
+    """Maps an (h, w, 3) RGB array onto PALETTE indices, optionally dithered."""
+    if dither == "ordered":
+        height, width, _ = rgb.shape
+        threshold = np.tile(BAYER, (height // 4 + 1, width // 4 + 1))[:height, :width]
+        return _lookup(rgb.astype(np.float64) + threshold[..., None] * ORDERED_SPREAD, metric)
+    if dither == "floyd-steinberg":
+        return _error_diffusion(rgb, metric)
+    return _lookup(rgb, metric)
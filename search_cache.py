@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import time
+from typing import List, Optional
+
+from PIL import Image, PngImagePlugin
+
+import disk_cache
+
+SEARCH_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "autoskribbler", "search")
+
+
+def normalize(query: str) -> str:
+    """Search terms that only differ in case and spacing find the same images."""
+    return " ".join(query.lower().split())
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class SearchCache:
+    """Image search results (query -> URLs) and their thumbnails (URL -> image) on disk.
+
+    Entries expire after their TTL, counted from when they were stored. Like the PlanCache, every use
+    touches the file and the least recently used ones go once the cache outgrows max_bytes. Plans of
+    the thumbnails need no entry here, the PlanCache finds them by their content.
+    """
+
+    def __init__(self, directory=SEARCH_CACHE_DIR, max_bytes=128 * 1024 * 1024, urls_ttl=7 * 24 * 3600,
+                 thumbnails_ttl=30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.urls_ttl = urls_ttl
+        self.thumbnails_ttl = thumbnails_ttl
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, path, write):
+        disk_cache.write_atomically(path, write)
+        self.evict()
+
+    def get_urls(self, query) -> Optional[List[str]]:
+        path = self._path(_digest(normalize(query)) + ".json")
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.urls_ttl:
+            return None
+        os.utime(path)
+        return entry["urls"]
+
+    def put_urls(self, query, urls: List[str]):
+        def write(path):
+            with open(path, "w") as file:
+                json.dump({"query": normalize(query), "created": time.time(), "urls": list(urls)}, file)
+        self._write(self._path(_digest(normalize(query)) + ".json"), write)
+
+    def get_thumbnail(self, url) -> Optional[Image.Image]:
+        path = self._path(_digest(url) + ".png")
+        try:
+            with Image.open(path) as img:
+                img.load()
+        except (OSError, ValueError):
+            return None
+        if time.time() - float(img.text.get("created", 0)) > self.thumbnails_ttl:
+            return None
+        os.utime(path)
+        return img
+
+    def put_thumbnail(self, url, img: Image.Image):
+        info = PngImagePlugin.PngInfo()
+        info.add_text("url", url)
+        info.add_text("created", repr(time.time()))
+        self._write(self._path(_digest(url) + ".png"), lambda path: img.save(path, "PNG", pnginfo=info))
+
+    def evict(self):
+        disk_cache.evict(self.directory, self.max_bytes, (".json", ".png"))
@@ -0,0 +1,131 @@
+from typing import List
+
+import numpy as np
+
+# the 8 neighbours of a pixel clockwise from the top, as (dy, dx); Zhang-Suen counts on this order
+NEIGHBOURS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+
+def _neighbours(mask: np.ndarray) -> List[np.ndarray]:
+    """The 8 shifted copies of a mask, in NEIGHBOURS order; outside the mask counts as unset."""
+    height, width = mask.shape
+    padded = np.pad(mask, 1)
+    return [padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width] for dy, dx in NEIGHBOURS]
+
+
+def edges(idx: np.ndarray, luminance: np.ndarray) -> np.ndarray:
+    """Marks the boundaries between areas of different colors, on the darker side of each.
+
+    `luminance` has the brightness of every palette index. Taking the darker pixel of every pair of
+    differing 4-neighbours keeps outlines where they are in line art: a dark line on a light background
+    is marked itself instead of getting an edge on both of its sides.
+    """
+    lum = luminance[idx]
+    marked = np.zeros(idx.shape, dtype=bool)
+    # pairs side by side, then pairs on top of each other
+    for first, second in (((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                          ((slice(None, -1),), (slice(1, None),))):
+        differ = idx[first] != idx[second]
+        marked[first] |= differ & (lum[first] <= lum[second])
+        marked[second] |= differ & (lum[second] <= lum[first])
+    return marked
+
+
+def thin(mask: np.ndarray) -> np.ndarray:
+    """Thins a mask down to lines one pixel wide (Zhang-Suen), keeping it connected."""
+    mask = mask.copy()
+    while True:
+        changed = False
+        for step in range(2):
+            p2, p3, p4, p5, p6, p7, p8, p9 = _neighbours(mask)
+            ring = [p2, p3, p4, p5, p6, p7, p8, p9, p2]
+            count = sum(p.astype(np.uint8) for p in ring[:8])
+            transitions = sum((~a & b).astype(np.uint8) for a, b in zip(ring, ring[1:]))
+            if step == 0:
+                side = ~(p2 & p4 & p6) & ~(p4 & p6 & p8)
+            else:
+                side = ~(p2 & p4 & p8) & ~(p2 & p6 & p8)
+            remove = mask & (count >= 2) & (count <= 6) & (transitions == 1) & side
+            if remove.any():
+                mask &= ~remove
+                changed = True
+        if not changed:
+            return mask
+
+
+def trace(mask: np.ndarray) -> List[List[tuple]]:
+    """Follows the pixels of a thin mask into polylines of (x, y) points, 8-connected.
+
+    Walks start at line ends, then anywhere on what is left (closed loops). Every walk keeps going to an
+    unvisited neighbour, straight ahead if possible, and ends on the already visited pixel it runs into,
+    if any, so branches stay attached to the line they split off from.
+    """
+    height, width = mask.shape
+    remaining = mask.copy()
+    degree = sum(p.astype(np.uint8) for p in _neighbours(mask))
+    ys, xs = np.nonzero(mask & (degree == 1))
+    starts = list(zip(xs.tolist(), ys.tolist()))
+    ys, xs = np.nonzero(mask)
+    starts += list(zip(xs.tolist(), ys.tolist()))
+
+    def next_pixel(x, y, direction, free, exclude=()):
+        best = None
+        for dy, dx in NEIGHBOURS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and mask[ny, nx] and remaining[ny, nx] == free and \
+                    (nx, ny) not in exclude:
+                # straight on first, then 4-neighbours before diagonal ones
+                score = (dx, dy) != direction, abs(dx) + abs(dy)
+                if best is None or score < best[0]:
+                    best = (score, (nx, ny))
+        return best and best[1]
+
+    lines = []
+    for x, y in starts:
+        if not remaining[y, x]:
+            continue
+        remaining[y, x] = False
+        line = [(x, y)]
+        joined = next_pixel(x, y, None, False)
+        if joined is not None:
+            line.insert(0, joined)
+        direction = None
+        while True:
+            step = next_pixel(x, y, direction, True)
+            if step is None:
+                break
+            direction = (step[0] - x, step[1] - y)
+            x, y = step
+            remaining[y, x] = False
+            line.append((x, y))
+        # the pixels just walked over are next to the end as well, they don't count as running into something
+        joined = next_pixel(x, y, direction, False, exclude=line[-3:-1])
+        if joined is not None:
+            line.append(joined)
+        lines.append(line)
+    return lines
+
+
+def simplify(points, epsilon) -> np.ndarray:
+    """Douglas-Peucker: drops points that are less than `epsilon` away from the line that replaces them."""
+    points = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a, b = points[first], points[last]
+        inner = points[first + 1:last]
+        d = b - a
+        if d.any():
+            distances = np.abs(d[0] * (inner[:, 1] - a[1]) - d[1] * (inner[:, 0] - a[0])) / np.hypot(*d)
+        else:  # a closed loop, measured from its start
+            distances = np.hypot(*(inner - a).T)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > epsilon:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack += [(first, middle), (middle, last)]
+    return points[keep].astype(np.int16)
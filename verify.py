@@ -0,0 +1,88 @@
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import ordering
+import planner
+from planner import ColorStrokes
+
+log = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in screen pixels, right and bottom exclusive
+
+
+class CaptureSource:
+    """Where the verification gets its pictures of the canvas from."""
+
+    def grab(self, box: Box) -> Image.Image:
+        raise NotImplementedError
+
+
+class ScreenCapture(CaptureSource):
+    """Takes screenshots of the real screen."""
+
+    def grab(self, box: Box) -> Image.Image:
+        from PIL import ImageGrab
+        img = ImageGrab.grab(bbox=box)
+        size = (box[2] - box[0], box[3] - box[1])
+        if img.size != size:
+            img = img.resize(size, Image.NEAREST)  # screens that scale, every pixel is captured several times
+        return img
+
+
+def canvas_box(canvas_top_left, shape, step_size=planner.CELL_SIZE) -> Box:
+    """The part of the screen the cells of a drawing grid of `shape` are drawn at."""
+    height, width = shape
+    left, top = canvas_top_left
+    return left, top, left + round((width - 1) * step_size) + 1, top + round((height - 1) * step_size) + 1
+
+
+def sample(img: Image.Image, shape, step_size=planner.CELL_SIZE) -> np.ndarray:
+    """Reads the drawing grid back from a capture of its canvas_box, as PALETTE indices.
+
+    Every cell gets the palette color closest to the pixel its strokes are drawn through.
+    """
+    height, width = shape
+    rgb = np.asarray(img.convert("RGB"), dtype=np.int32)
+    ys = np.round(np.arange(height) * step_size).astype(int)
+    xs = np.round(np.arange(width) * step_size).astype(int)
+    pixels = rgb[ys[:, None], xs[None, :]]
+    distances = ((pixels[:, :, None, :] - np.array(planner.PALETTE)) ** 2).sum(axis=3)
+    return np.argmin(distances, axis=2).astype(np.uint8)
+
+
+def plan_correction(idx: np.ndarray, wrong: np.ndarray, sizes=planner.BRUSH_SIZES,
+                    cell=planner.CELL_SIZE) -> List[ColorStrokes]:
+    """Redraws only the wrong cells, white ones included, like the last pass of planner.iter_progressive."""
+    plan = planner.plan_brush_sizes(idx, sizes, cell, skip=planner.NO_SKIP, mask=wrong)
+    return [ordering.order_color_strokes(color) for color in plan]
+
+
+def correct(drawer, capture: CaptureSource, idx: np.ndarray, passes=2, sizes=planner.BRUSH_SIZES,
+            settle=0.2, cancel: Optional[threading.Event] = None) -> List[float]:
+    """Compares what is on the canvas with the target and redraws what is wrong, up to `passes` times.
+
+    Dropped or merged input events leave gaps on the canvas that no plan knows about, so the canvas is
+    captured after waiting `settle` seconds for the game to show the last strokes, read back onto the
+    grid at the Drawer's calibration and step size, and diffed with `idx`. It stops early once a pass
+    does not make things better, which happens when the game keeps missing events. Returns the share of
+    wrong cells before the first correction pass and after every pass.
+    """
+    box = canvas_box(drawer.canvas_top_left, idx.shape, drawer.step_size)
+    residuals = []
+    for n in range(passes + 1):
+        drawer.mouse.flush()
+        drawer.mouse.sleep(settle)
+        wrong = sample(capture.grab(box), idx.shape, drawer.step_size) != idx
+        residuals.append(float(np.mean(wrong)))
+        log.info("%d cells wrong (%.2f %%) after %d correction passes", np.count_nonzero(wrong),
+                 100 * residuals[-1], n)
+        if n == passes or not wrong.any() or (n and residuals[-1] >= residuals[-2]) or \
+                (cancel is not None and cancel.is_set()):
+            break
+        if drawer.draw(plan_correction(idx, wrong, sizes, drawer.cell), cancel) is not None:
+            break  # a correction pass is never resumed, the next verification would start over anyway
+    return residuals